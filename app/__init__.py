@@ -4,7 +4,7 @@ from flask_migrate import Migrate
 from flask_login import LoginManager, login_user, current_user, logout_user, login_required
 import os
 import logging
-from .models import db, User
+from .models import db, User, Organization
 from .utils.logger_setup import configure_logging
 from .main import main as main_blueprint
 from .super_admin import super_admin as super_blueprint
@@ -14,6 +14,7 @@ from .marketing import marketing as marketing_blueprint
 from .recall import recall as recall_blueprint
 from config import Config
 from .socket_events import register_events
+from .utils.mongo import ensure_indexes_for_orgs
 from flask_cors import CORS
 from flask_talisman import Talisman
 from flask_jwt_extended import JWTManager
@@ -28,6 +29,21 @@ socketio = SocketIO(cors_allowed_origins=TRUSTED_DOMAIN,
                     async_mode='eventlet')  # Create the SocketIO instance globally
 
 
+def ensure_org_indexes(app):
+    """
+    Create and verify the Mongo indexes for every organization's database.
+    """
+
+    try:
+        with app.app_context():
+            org_names = [org.name for org in Organization.query.all()]
+
+        ensure_indexes_for_orgs(org_names)
+
+    except Exception as e:
+        logging.error(f"Failed to ensure Mongo indexes on startup: {e}")
+
+
 def create_app():
     
     # Initialize Flask app
@@ -105,6 +121,10 @@ def create_app():
 
     register_events(socketio)  # Register your socket.io event handlers
 
+    # Ensure Mongo indexes in the background so startup isn't held up
+    if os.getenv("MONGO_ENSURE_INDEXES_ON_STARTUP", "true").lower() == "true":
+        socketio.start_background_task(ensure_org_indexes, app)
+
     # Custom error handlers for API responses
     @app.errorhandler(404)
     def not_found(error):
@@ -3,14 +3,14 @@ from flask import jsonify, request
 from flask_jwt_extended import jwt_required, verify_jwt_in_request
 from ..models import Organization, User, db, Invites, Reports, Free_Access_Invites
 from sqlalchemy.orm import aliased
-from ..utils.mongo import get_meetings_last_month, duration_to_seconds
+from ..utils.mongo import get_meeting_stats
 from ..utils.Emails import send_invite_email
-from ..utils.llm_interactions import generate_ai_reply
+from ..utils.llm_interactions import generate_ai_reply, generate_uuid
 import secrets
 from datetime import datetime
 import logging
 from bson import ObjectId
-from ..utils.mongo import get_all_manager_meetings, get_one_on_ones, get_all_employee_meetings, fetch_prompts, update_prompts, add_new_meeting_type, delete_prompts, get_recent_meetings, delete_meeting
+from ..utils.mongo import get_all_manager_meetings, get_one_on_ones, get_all_employee_meetings, fetch_prompts, update_prompts, add_new_meeting_type, delete_prompts, get_recent_meetings, delete_meeting, MEETING_CARD_PROJECTION, parse_page_args, split_page
 
 @admin.route('/api/get_managers', methods=["POST"])
 @jwt_required()
@@ -47,33 +47,21 @@ def get_managers():
 
     managers = []
 
-    for manager in managers_list_db:
-
-        if manager.id == 167 or manager.id == 229:
-            continue
-
-        meetings_in_past_x_days = get_meetings_last_month(org_name, org_id, manager.id, role="Manager", days=days)
+    managers_list_db = [manager for manager in managers_list_db if manager.id not in [167, 229]]
 
-        # Number of meetings in the past month divided by the number of direct reports
-        num_meetings_in_past_month = len(meetings_in_past_x_days)
+    # Meeting counts and average 1:1 length for every manager in one aggregation
+    meeting_stats = get_meeting_stats(org_name, org_id, role="Manager", days=days,
+                                      user_ids=[manager.id for manager in managers_list_db])
 
-        # Average length of 1:1 meeting in last month
-        meeting_lengths = []
-        for meeting in meetings_in_past_x_days:
-            duration_str = meeting.get("meeting_duration", "0h 0m 0s")
-            total_seconds = duration_to_seconds(duration_str)
-            meeting_lengths.append(total_seconds)
+    for manager in managers_list_db:
 
-        if len(meeting_lengths) == 0:
-            average_length_minutes = 0
-        else:
-            average_length_minutes = round(sum(meeting_lengths) / len(meeting_lengths) / 60, 2)        
+        stats = meeting_stats.get(manager.id, {})
 
         managers.append({"id": manager.id, 
                          "first_name": manager.first_name, 
                          "last_name": manager.last_name,
-                         "num_meetings": num_meetings_in_past_month,
-                         "average_length_minutes": average_length_minutes,
+                         "num_meetings": stats.get("num_meetings", 0),
+                         "average_length_minutes": stats.get("average_length_minutes", 0),
                          "num_reports": len(manager.managed_reports)})
 
     return jsonify({"current_user": int(current_user.get_id()), "managers": managers}), 200
@@ -135,30 +123,18 @@ def get_employees():
         
     # Use a dictionary to aggregate managers per employee
     employees_dict = {}
+
+    # Skip specific report IDs if necessary
+    employees_managers = [em for em in employees_managers if em.report_id not in [167, 172]]
+
+    # Meeting counts and average 1:1 length for every employee in one aggregation
+    meeting_stats = get_meeting_stats(org_name, org_id, role="Report", days=days,
+                                      user_ids={em.report_id for em in employees_managers})
     
     for em in employees_managers:
-        # Skip specific report IDs if necessary
-        if em.report_id in [167, 172]:
-            continue
         
         if em.report_id not in employees_dict:
-            # Fetch meetings data
-            meetings_in_past_x_days = get_meetings_last_month(org_name, org_id, em.report_id, role="Report", days=days)
-
-            # Number of meetings in the past month
-            num_meetings_in_past_month = len(meetings_in_past_x_days)
-
-            # Calculate average meeting length in minutes
-            meeting_lengths = []
-            for meeting in meetings_in_past_x_days:
-                duration_str = meeting.get("meeting_duration", "0h 0m 0s")
-                total_seconds = duration_to_seconds(duration_str)
-                meeting_lengths.append(total_seconds)
-
-            if len(meeting_lengths) == 0:
-                average_length_minutes = 0
-            else:
-                average_length_minutes = round(sum(meeting_lengths) / len(meeting_lengths) / 60, 2)
+            stats = meeting_stats.get(em.report_id, {})
             
             # Initialize employee entry with an empty list of managers
             employees_dict[em.report_id] = {
@@ -166,8 +142,8 @@ def get_employees():
                 "first_name": em.employee_first_name,  
                 "last_name": em.employee_last_name,
                 "email": em.employee_email,  
-                "num_meetings": num_meetings_in_past_month,
-                "average_length_minutes": average_length_minutes,
+                "num_meetings": stats.get("num_meetings", 0),
+                "average_length_minutes": stats.get("average_length_minutes", 0),
                 "managers": []  # Initialize empty list for managers
             }
         
@@ -253,6 +229,17 @@ def verify_token():
 @admin.route('/api/manager/<int:manager_id>', methods=["GET"])
 @jwt_required()
 def get_manager(manager_id):
+    """
+    GET request:
+        - Query parameters (optional): limit, after
+
+        - Without either, every meeting is returned and next_cursor is null.
+          This is deprecated and logged, clients should always pass limit.
+          With limit (at most 200) or an after cursor, one page is returned,
+          newest first, 50 meetings by default. Pass next_cursor back as
+          after for the next page; it is null on the last page.
+    """
+
     claims = verify_jwt_in_request()[1]
     org_id = claims['sub']['org_id']
     user_id = claims['sub']['user_id']
@@ -275,16 +262,33 @@ def get_manager(manager_id):
     
     attendee_info = {"manager_id": manager_id}
 
-    meetings = get_all_manager_meetings(org.name, org_id, 365, attendee_info)
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    meetings, next_cursor = split_page(get_all_manager_meetings(org.name, org_id, 365, attendee_info, projection=MEETING_CARD_PROJECTION,
+                                                                limit=limit, after=after), limit)
 
     meetings_list = [{"meeting_id": str(m["_id"]), "date": m["date"], "duration": m["meeting_duration"], "type": m["type_name"], "attendees": m["attendees"], "summary": m["summary"]["Meeting Summary"]} for m in meetings]
 
     print(meetings_list)
-    return jsonify({"manager": {"id": manager.id, "first_name": manager.first_name, "last_name": manager.last_name}, "meetings": meetings_list}), 200
+    return jsonify({"manager": {"id": manager.id, "first_name": manager.first_name, "last_name": manager.last_name}, "meetings": meetings_list, "next_cursor": next_cursor}), 200
 
 @admin.route('/api/employee/<int:employee_id>', methods=["GET"])
 @jwt_required()
 def get_employee(employee_id):
+    """
+    GET request:
+        - Query parameters (optional): limit, after
+
+        - Without either, every meeting is returned and next_cursor is null.
+          This is deprecated and logged, clients should always pass limit.
+          With limit (at most 200) or an after cursor, one page is returned,
+          newest first, 50 meetings by default. Pass next_cursor back as
+          after for the next page; it is null on the last page.
+    """
+
     claims = verify_jwt_in_request()[1]
     org_id = claims['sub']['org_id']
     user_id = claims['sub']['user_id']
@@ -309,16 +313,33 @@ def get_employee(employee_id):
 
     days=365
 
-    meetings = get_all_employee_meetings(org.name, org_id, days, attendee_info)
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    meetings, next_cursor = split_page(get_all_employee_meetings(org.name, org_id, days, attendee_info, projection=MEETING_CARD_PROJECTION,
+                                                                 limit=limit, after=after), limit)
 
     meetings_list = [{"meeting_id": str(m["_id"]), "date": m["date"], "duration": m["meeting_duration"], "type": m["type_name"], "attendees": m["attendees"], "summary": m["summary"]["Meeting Summary"]} for m in meetings]
 
-    return jsonify({"employee": {"id": employee.id, "first_name": employee.first_name, "last_name": employee.last_name}, "meetings": meetings_list}), 200
+    return jsonify({"employee": {"id": employee.id, "first_name": employee.first_name, "last_name": employee.last_name}, "meetings": meetings_list, "next_cursor": next_cursor}), 200
 
 
 @admin.route('/api/manager/oneonones/<int:manager_id>', methods=["GET"])
 @jwt_required()
 def get_manager_oneonones(manager_id):
+    """
+    GET request:
+        - Query parameters (optional): limit, after
+
+        - Without either, every meeting is returned and next_cursor is null.
+          This is deprecated and logged, clients should always pass limit.
+          With limit (at most 200) or an after cursor, one page is returned,
+          newest first, 50 meetings by default. Pass next_cursor back as
+          after for the next page; it is null on the last page.
+    """
+
     claims = verify_jwt_in_request()[1]
     org_id = claims['sub']['org_id']
     user_id = claims['sub']['user_id']
@@ -340,11 +361,17 @@ def get_manager_oneonones(manager_id):
     
     attendee_info = {"manager_id": manager_id}
 
-    meetings = get_one_on_ones(org.name, org_id, attendee_info)
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    meetings, next_cursor = split_page(get_one_on_ones(org.name, org_id, attendee_info, projection=MEETING_CARD_PROJECTION,
+                                                       limit=limit, after=after), limit)
 
     meetings_list = [{"meeting_id": str(m["_id"]), "date": m["date"], "duration": m["meeting_duration"], "type": m["type_name"], "attendees": m["attendees"], "summary": m["summary"]["Meeting Summary"]} for m in meetings]
 
-    return jsonify({"manager": {"id": manager.id, "first_name": manager.first_name, "last_name": manager.last_name}, "meetings": meetings_list}), 200
+    return jsonify({"manager": {"id": manager.id, "first_name": manager.first_name, "last_name": manager.last_name}, "meetings": meetings_list, "next_cursor": next_cursor}), 200
     
 @admin.route('/api/update_prompt_admin/<prompt_id>', methods=["POST"])
 @jwt_required()
@@ -518,7 +545,7 @@ def get_most_recent_meetings():
 
     org = Organization.query.get(org_id)
 
-    meetings = get_recent_meetings(org.name, org_id, "One-on-One", 10)
+    meetings = get_recent_meetings(org.name, org_id, "One-on-One", 10, projection=MEETING_CARD_PROJECTION)
 
     meetings_list = [{"meeting_id": str(m["_id"]), "date": m["date"], "duration": m["meeting_duration"], "type": m["type_name"], "attendees": m["attendees"], "summary": m["summary"]["Meeting Summary"]} for m in meetings]
 
@@ -825,6 +852,8 @@ def chat_admin():
     days = data.get("days")
     reframe_prompt = data.get("reframe_prompt")
     ai_model = data.get("ai_model")
+    use_transcripts = data.get("use_transcripts", False)
+    conversation_id = data.get("conversation_id") or generate_uuid()
     print(f"Received AI model: {ai_model}")
 
     if not messages:
@@ -844,11 +873,13 @@ def chat_admin():
             employee_ids=employee_ids, 
             manager_ids=manager_ids,
             ai_model=ai_model,
-            reframe_prompt=reframe_prompt
+            reframe_prompt=reframe_prompt,
+            use_transcripts=use_transcripts,
+            conversation_id=conversation_id
         )
 
     except Exception as e:
         print(f"Error generating AI reply: {e}")
         return jsonify({"error": "Failed to generate AI reply"}), 500
 
-    return jsonify({"reply": reply}), 200
+    return jsonify({"reply": reply, "conversation_id": conversation_id}), 200
@@ -1,7 +1,7 @@
 from flask import render_template, jsonify, redirect, url_for, request, session
 from ..models import User, Reports, db, Organization, BotRecord
 from . import main
-from ..utils.s3_utils import check_existing_s3_files, read_text_file
+from ..utils.s3_utils import read_text_file
 from datetime import datetime
 from flask_socketio import emit
 from functools import wraps
@@ -10,8 +10,8 @@ from svix.webhooks import Webhook, WebhookVerificationError
 from botocore.exceptions import ClientError
 from bson import ObjectId
 from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
-from ..utils.mongo import get_meeting_by_id, fetch_meeting_types, get_general_meetings, get_oneonone_meetings, fetch_personal_prompts, fetch_prompts, add_new_meeting_type, update_prompts, delete_prompts, get_one_on_ones, update_notes, get_meetings_last_month
-from ..utils.llm_interactions import generate_ai_reply
+from ..utils.mongo import get_meeting_by_id, fetch_meeting_types, get_general_meetings, get_oneonone_meetings, fetch_personal_prompts, fetch_prompts, add_new_meeting_type, update_prompts, delete_prompts, get_one_on_ones, update_notes, get_meeting_stats, build_session_key, recording_session_exists, MEETING_CARD_PROJECTION, parse_page_args, split_page
+from ..utils.llm_interactions import generate_ai_reply, generate_uuid
 
 # Utility function to convert ObjectId to string
 def convert_object_id_to_str(data):
@@ -196,6 +196,16 @@ def remove_report(report_id):
 @main.route("/api/view_meetings/oneonone/<int:report_id>", methods=["GET"])
 @jwt_required()
 def view_oneonone_meetings(report_id):
+    """
+    GET request:
+        - Query parameters (optional): limit, after
+
+        - Without either, every meeting is returned and next_cursor is null.
+          This is deprecated and logged, clients should always pass limit.
+          With limit (at most 200) or an after cursor, one page is returned,
+          newest first, 50 meetings by default. Pass next_cursor back as
+          after for the next page; it is null on the last page.
+    """
 
     claims = verify_jwt_in_request()[1]
     org_id = claims['sub']['org_id']
@@ -214,14 +224,20 @@ def view_oneonone_meetings(report_id):
     
     attendee_info = {"manager_id": user_id, "report_id": report_id}
 
-    meetings = get_oneonone_meetings("One-on-One", org.name, org_id, attendee_info)
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    meetings, next_cursor = split_page(get_oneonone_meetings("One-on-One", org.name, org_id, attendee_info, projection=MEETING_CARD_PROJECTION,
+                                                             limit=limit, after=after), limit)
 
     meetings_list = [{"meeting_id": str(m["_id"]), 
                     "date": m["date"], 
                     "summary": m["summary"].get("Meeting Summary") or m["summary"].get("Meeting summary")} 
                     for m in meetings]
     
-    return jsonify({"report": {"id": report.id, "first_name": report.first_name, "last_name": report.last_name}, "meetings": meetings_list}), 200
+    return jsonify({"report": {"id": report.id, "first_name": report.first_name, "last_name": report.last_name}, "meetings": meetings_list, "next_cursor": next_cursor}), 200
 
 @main.route('/api/meeting/<string:meeting_id>', methods=["GET"])
 @jwt_required()
@@ -294,10 +310,7 @@ def oneonone(report_id):
     firstname = report.first_name
     lastname = report.last_name
 
-    list_s3 = check_existing_s3_files()
-    list_s3_webm = set(["/".join(x.rsplit("/", 1)[:-1]) for x in list_s3])
-
-    if (f"{username}/{firstname}{lastname}/{date}" in list_s3_webm) or (f"Summary_{username}_{firstname}{lastname}_{date}.txt" in list_s3):
+    if recording_session_exists(build_session_key(username, f"{firstname}{lastname}", date)):
         return jsonify({"error": "Duplicate record found."}), 409
 
     return  jsonify({
@@ -353,10 +366,7 @@ def generalmeeting(meeting_type):
     firstname = meeting_type
     lastname = ""
 
-    list_s3 = check_existing_s3_files()
-    list_s3_webm = set(["/".join(x.rsplit("/", 1)[:-1]) for x in list_s3])
-
-    if (f"{username}/{firstname}{lastname}/{date}" in list_s3_webm) or (f"Summary_{username}_{firstname}{lastname}_{date}.txt" in list_s3):
+    if recording_session_exists(build_session_key(username, f"{firstname}{lastname}", date)):
         return jsonify({"error": "Duplicate record found."}), 409
     
     return  jsonify({
@@ -409,10 +419,7 @@ def othermeeting(meeting_type):
     firstname = meeting_type
     lastname = ""
 
-    list_s3 = check_existing_s3_files()
-    list_s3_webm = set(["/".join(x.rsplit("/", 1)[:-1]) for x in list_s3])
-
-    if (f"{username}/{firstname}{lastname}/{date}" in list_s3_webm) or (f"Summary_{username}_{firstname}{lastname}_{date}.txt" in list_s3):
+    if recording_session_exists(build_session_key(username, f"{firstname}{lastname}", date)):
         return jsonify({"error": "Duplicate record found."}), 409
     
     return  jsonify({
@@ -490,6 +497,14 @@ def view_other_meeting(meeting_type):
         - Returns: {
                         "meeting_types": ["One-on-One", "Any"]
                     }
+
+        - Query parameters (optional): limit, after
+
+        - Without either, every meeting is returned and next_cursor is null.
+          This is deprecated and logged, clients should always pass limit.
+          With limit (at most 200) or an after cursor, one page is returned,
+          newest first, 50 meetings by default. Pass next_cursor back as
+          after for the next page; it is null on the last page.
     """
 
     claims = verify_jwt_in_request()[1]
@@ -507,7 +522,13 @@ def view_other_meeting(meeting_type):
     attendee_info = {"user_id": user_id,
                      "role": "Manager"}
     
-    meetings = get_general_meetings(meeting_type, org.name, org_id, attendee_info)
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    meetings, next_cursor = split_page(get_general_meetings(meeting_type, org.name, org_id, attendee_info, projection=MEETING_CARD_PROJECTION,
+                                                            limit=limit, after=after), limit)
 
     meetings_list = [{"meeting_id": str(m["_id"]), 
                     "date": m["date"], 
@@ -515,7 +536,7 @@ def view_other_meeting(meeting_type):
                     for m in meetings]
     
     print(meetings_list)
-    return jsonify({"meetings": meetings_list}), 200
+    return jsonify({"meetings": meetings_list, "next_cursor": next_cursor}), 200
 
 @main.route('/api/view_meetings/generalmeeting', methods=['GET'])
 @jwt_required()
@@ -526,6 +547,14 @@ def view_general_meetings():
         - Returns: {
                         "meeting_types": ["One-on-One", "Any"]
                     }
+
+        - Query parameters (optional): limit, after
+
+        - Without either, every meeting is returned and next_cursor is null.
+          This is deprecated and logged, clients should always pass limit.
+          With limit (at most 200) or an after cursor, one page is returned,
+          newest first, 50 meetings by default. Pass next_cursor back as
+          after for the next page; it is null on the last page.
     """
 
     claims = verify_jwt_in_request()[1]
@@ -543,7 +572,13 @@ def view_general_meetings():
     attendee_info = {"user_id": user_id,
                      "role": "Manager"}
     
-    meetings = get_general_meetings(meeting_type, org.name, org_id, attendee_info)
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    meetings, next_cursor = split_page(get_general_meetings(meeting_type, org.name, org_id, attendee_info, projection=MEETING_CARD_PROJECTION,
+                                                            limit=limit, after=after), limit)
 
     meetings_list = [{"meeting_id": str(m["_id"]), 
                     "date": m["date"], 
@@ -552,7 +587,7 @@ def view_general_meetings():
                     for m in meetings]
     
     print(meetings_list)
-    return jsonify({"meetings": meetings_list}), 200
+    return jsonify({"meetings": meetings_list, "next_cursor": next_cursor}), 200
 
 @main.route('/api/fetch_prompts_manager', methods=["GET"])
 @jwt_required()
@@ -968,6 +1003,11 @@ def chat_manager():
     employee_ids = data.get('selectedEmployees')
     days = data.get('days')
     reframe_prompt = data.get('reframe_prompt')
+    use_transcripts = data.get('use_transcripts', False)
+
+    # Earlier turns of the conversation are kept server side, so clients only
+    # need to send the new message along with the conversation id
+    conversation_id = data.get('conversation_id') or generate_uuid()
 
     print(f"Messages: {messages}")
     print(f"Employees: {employee_ids}")
@@ -975,21 +1015,26 @@ def chat_manager():
     if not messages:
         return jsonify({"error": "Missing 'messages' in request"}), 400
 
+    # Extract only the latest message
+    latest_message = messages[-1]["text"]
+
     # Process the messages and page URL
     try:
-        reply = str(generate_ai_reply(messages, 
+        reply = str(generate_ai_reply(latest_message, 
                                       user_id, 
                                       org_name, 
                                       org_id=org_id, 
                                       days=days,
                                       employee_ids=employee_ids,
-                                      reframe_prompt = reframe_prompt))
+                                      reframe_prompt = reframe_prompt,
+                                      use_transcripts = use_transcripts,
+                                      conversation_id = conversation_id))
         
     except Exception as e:
         print(f"Error generating AI reply: {e}")
         return jsonify({"error": "Failed to generate AI reply"}), 500
 
-    return jsonify({"reply": reply}), 200
+    return jsonify({"reply": reply, "conversation_id": conversation_id}), 200
 
 
 @main.route('/api/view_meetings/oneonone', methods=["GET"])
@@ -997,6 +1042,14 @@ def chat_manager():
 def get_manager_oneonones():
     """
     Get all one on one meetings associated with the manager (current user)
+
+        - Query parameters (optional): limit, after
+
+        - Without either, every meeting is returned and next_cursor is null.
+          This is deprecated and logged, clients should always pass limit.
+          With limit (at most 200) or an after cursor, one page is returned,
+          newest first, 50 meetings by default. Pass next_cursor back as
+          after for the next page; it is null on the last page.
     """
 
     claims = verify_jwt_in_request()[1]
@@ -1016,13 +1069,19 @@ def get_manager_oneonones():
     
     attendee_info = {"manager_id": user_id}
 
-    meetings = get_one_on_ones(org.name, org_id, attendee_info)
+    try:
+        limit, after = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    meetings, next_cursor = split_page(get_one_on_ones(org.name, org_id, attendee_info, projection=MEETING_CARD_PROJECTION,
+                                                       limit=limit, after=after), limit)
 
     meetings_list = [{"meeting_id": str(m["_id"]), "date": m["date"], "duration": m["meeting_duration"], "type": m["type_name"], "attendees": m["attendees"], "summary": m["summary"]["Meeting Summary"]} for m in meetings]
 
     logging.info("MEETING LIST:", meetings_list)
 
-    return jsonify({"manager": {"id": manager.id, "first_name": manager.first_name, "last_name": manager.last_name}, "meetings": meetings_list}), 200
+    return jsonify({"manager": {"id": manager.id, "first_name": manager.first_name, "last_name": manager.last_name}, "meetings": meetings_list, "next_cursor": next_cursor}), 200
 
 @main.route('/api/fetch_prompts', methods=["GET"])
 @jwt_required()
@@ -1172,17 +1231,16 @@ def get_employees_by_manager():
     if not direct_reports:
         return jsonify({"reports": []}), 200
 
+    # Meeting counts for every direct report in one aggregation
+    meeting_stats = get_meeting_stats(org_name, org_id, role="Report", days=days,
+                                      user_ids=[report.report_id for report in direct_reports])
+
     # Prepare the list of direct reports
     reports_list = []
     for report in direct_reports:
         report_user = User.query.get(report.report_id)
         if report_user:
-            # Calculate num_meetings for this report
-            meetings_in_past_x_days = get_meetings_last_month(org_name, org_id, report_user.id, role="Report", days=days)
-            print(report_user.first_name)
-            num_meetings = len(meetings_in_past_x_days)
-            print(num_meetings)
-
+            num_meetings = meeting_stats.get(report_user.id, {}).get("num_meetings", 0)
 
             reports_list.append({
                 "id": report_user.id,
@@ -1,10 +1,12 @@
 from flask_socketio import disconnect
 from flask import current_app, request
 from app.models import User, Organization
-from .utils.s3_utils import upload_audio_to_s3
-from io import BytesIO
+from .utils.mongo import mark_recording_started, build_session_key
+from .utils.audio_ingest import add_chunk, take_remaining, has_in_flight, has_buffered, flush_chunks, FLUSH_RETRIES
+from .utils.llm_interactions import stream_ai_reply, generate_uuid
 from .tasks import do_file_conversions, dummy_task
 from threading import Lock
+from cachetools import TTLCache
 from flask_jwt_extended import decode_token, verify_jwt_in_request, get_jwt_identity
 import jwt
 import logging
@@ -15,6 +17,49 @@ logger = logging.getLogger(__name__)
 
 # audio_end_lock = Lock()
 
+# Sessions already written to the recording index by this process, so the
+# index is only hit once per recording rather than once per chunk. Entries
+# are dropped at audio_end, and expire after the longest recording in case
+# audio_end never comes; a repeated write is harmless.
+indexed_sessions = TTLCache(maxsize=4096, ttl=6 * 3600)
+indexed_sessions_lock = Lock()
+
+def index_recording_session(key):
+    """
+    Add the session a chunk belongs to ("username_report_date") to the
+    recording index the first time one of its chunks is seen.
+    """
+
+    session_key = key.rsplit("_", 1)[0]
+
+    with indexed_sessions_lock:
+        if session_key in indexed_sessions:
+            return
+        indexed_sessions[session_key] = True
+
+    try:
+        mark_recording_started(session_key)
+    except Exception as e:
+        # Allow a later chunk to retry the write
+        with indexed_sessions_lock:
+            indexed_sessions.pop(session_key, None)
+        logger.error(f"Failed to index recording session {session_key}: {e}")
+
+# Socket id -> session keys that connection has sent chunks for, so buffers
+# can be flushed if the client disconnects without sending audio_end
+sessions_by_sid = {}
+
+# (socket id, request id) of chat streams the client has cancelled, checked
+# between tokens by the streaming task
+cancelled_chats = set()
+active_chats = set()
+chats_lock = Lock()
+
+def cancel_chat(sid, request_id):
+    with chats_lock:
+        if (sid, request_id) in active_chats:
+            cancelled_chats.add((sid, request_id))
+
 def verify_jwt(token):
     try:
         claims = decode_token(token)
@@ -25,6 +70,31 @@ def verify_jwt(token):
 
 def register_events(socketio):
 
+    def flush_sessions(session_keys):
+        """
+        Upload whatever is still buffered for the given sessions and wait for
+        background uploads to finish, so every chunk is in S3 before the
+        transcription task lists the bucket. Batches whose upload failed are
+        kept, so they get a few more rounds before giving up.
+        """
+
+        for session_key in session_keys:
+            for attempt in range(FLUSH_RETRIES):
+                for batch in take_remaining(session_key):
+                    flush_chunks(session_key, batch)
+
+                while has_in_flight(session_key):
+                    socketio.sleep(0.05)
+
+                if not has_buffered(session_key):
+                    break
+            else:
+                logger.error(f"Chunks for {session_key} could not be uploaded, the recording will be incomplete")
+
+            # The recording is over, so its index entry is no longer needed
+            with indexed_sessions_lock:
+                indexed_sessions.pop(session_key, None)
+
     @socketio.on('audio_chunk')
     def handle_audio_chunk(data):
         
@@ -40,22 +110,16 @@ def register_events(socketio):
         if number < 480:
 
             if audio:
-                # Create a BytesIO stream for this chunk
-                audio_stream = BytesIO(audio)
-                audio_stream.seek(0)
-
-                # Log chunk size
-                print("Appending chunk of size %d to stream for key: %s", len(audio), key)
-                
-                # Upload the file to S3
-                try:
-                    upload_audio_to_s3(audio_stream, key)
-                    print("Upload succeeded for key: %s", key)
+                session_key = key.rsplit("_", 1)[0]
+                sessions_by_sid.setdefault(request.sid, set()).add(session_key)
 
-                except Exception as e:
-                    print("Upload failed for key: %s with error: %s", key, e)
+                # Buffer the chunk, and once enough consecutive chunks have
+                # arrived upload them as one object in the background
+                ready = add_chunk(session_key, number, audio)
+                if ready:
+                    socketio.start_background_task(flush_chunks, session_key, ready)
 
-                audio_stream.close()
+                index_recording_session(key)
 
             else:
                 print("Audio file was empty.")
@@ -63,6 +127,101 @@ def register_events(socketio):
         else:
             print("An audio file from a meeting longer than 2 hours is trying to be uploaded. Blocking.")
 
+    @socketio.on('disconnect')
+    def handle_disconnect():
+        # Don't lose buffered chunks if the client goes away mid-recording
+        session_keys = sessions_by_sid.pop(request.sid, set())
+
+        for session_key in session_keys:
+            for batch in take_remaining(session_key):
+                socketio.start_background_task(flush_chunks, session_key, batch)
+
+        # Nobody is left to read any chat replies still streaming
+        with chats_lock:
+            for sid, request_id in active_chats:
+                if sid == request.sid:
+                    cancelled_chats.add((sid, request_id))
+
+    def run_chat_stream(sid, request_id, chat_args):
+        """
+        Stream a chat reply to one client as chat_token events, finishing with
+        chat_done (or chat_error).
+        """
+
+        def is_cancelled():
+            with chats_lock:
+                return (sid, request_id) in cancelled_chats
+
+        pieces = []
+        try:
+            for piece in stream_ai_reply(**chat_args, is_cancelled=is_cancelled):
+                pieces.append(piece)
+                socketio.emit('chat_token', {"request_id": request_id, "token": piece}, to=sid)
+
+            socketio.emit('chat_done', {"request_id": request_id, "conversation_id": chat_args["conversation_id"],
+                                        "reply": "".join(pieces), "cancelled": is_cancelled()}, to=sid)
+
+        except Exception as e:
+            logger.error(f"Error streaming AI reply: {e}")
+            socketio.emit('chat_error', {"request_id": request_id, "error": "Failed to generate AI reply"}, to=sid)
+
+        finally:
+            with chats_lock:
+                active_chats.discard((sid, request_id))
+                cancelled_chats.discard((sid, request_id))
+
+    @socketio.on('chat_stream')
+    def handle_chat_stream(data):
+        """
+        Streaming version of /api/chat_manager and /api/chat_admin. Expects the
+        same fields as those routes plus the JWT as "token", and an optional
+        "request_id" the client can use with chat_cancel.
+        """
+
+        request_id = data.get("request_id") or generate_uuid()
+
+        claims = verify_jwt(data.get("token"))
+        if not claims:
+            socketio.emit('chat_error', {"request_id": request_id, "error": "Please log in to access this route", "next_step": "login"}, to=request.sid)
+            return
+
+        org_id = claims['sub']['org_id']
+        user_id = claims['sub']['user_id']
+        role = claims['sub']['role']
+
+        messages = data.get("messages")
+        if not messages:
+            socketio.emit('chat_error', {"request_id": request_id, "error": "Missing 'messages' in request"}, to=request.sid)
+            return
+
+        org = Organization.query.get(org_id)
+
+        chat_args = {
+            "user_message": messages[-1]["text"],
+            "user_id": user_id,
+            "org_name": org.name,
+            "org_id": org_id,
+            "days": data.get("days"),
+            "employee_ids": data.get("selectedEmployees"),
+            # Only admins can ask across managers
+            "manager_ids": data.get("selectedManagers") if role == "admin" else None,
+            "ai_model": data.get("ai_model") or "gpt-4o",
+            "reframe_prompt": data.get("reframe_prompt"),
+            "use_transcripts": data.get("use_transcripts", False),
+            "conversation_id": data.get("conversation_id") or generate_uuid(),
+        }
+
+        with chats_lock:
+            active_chats.add((request.sid, request_id))
+
+        socketio.start_background_task(run_chat_stream, request.sid, request_id, chat_args)
+
+        return {"request_id": request_id, "conversation_id": chat_args["conversation_id"]}
+
+    @socketio.on('chat_cancel')
+    def handle_chat_cancel(data):
+        cancel_chat(request.sid, data.get("request_id"))
+
 
     @socketio.on('audio_end_oneonone')
     def handle_audio_end(data):
@@ -110,6 +269,10 @@ def register_events(socketio):
             if report:
                 emails.append(report.email)  # Adding the report's email
 
+            # Make sure all buffered audio is in S3 before processing
+            session_key = build_session_key(f"{user.first_name} {user.last_name}", f"{report.first_name}{report.last_name}", date)
+            flush_sessions(sessions_by_sid.pop(request.sid, set()) | {session_key})
+
             # Start celery worker
             try:
                 do_file_conversions.delay(attendees_info, "One-on-One", "One-on-One", duration, date, org_name=org_name, org_id=org_id)
@@ -157,6 +320,10 @@ def register_events(socketio):
             if user:
                 emails.append(user.email)  # Assuming the Users model has an 'email' field
 
+            # Make sure all buffered audio is in S3 before processing
+            session_key = build_session_key(f"{user.first_name} {user.last_name}", meeting_type, date)
+            flush_sessions(sessions_by_sid.pop(request.sid, set()) | {session_key})
+
             # Start celery worker
             try:
                 do_file_conversions.delay(attendees_info, meeting_type, meeting_name, duration, date, org_name=org_name, org_id=org_id)
@@ -204,6 +371,10 @@ def register_events(socketio):
             if user:
                 emails.append(user.email)  # Assuming the Users model has an 'email' field
 
+            # Make sure all buffered audio is in S3 before processing
+            session_key = build_session_key(f"{user.first_name} {user.last_name}", meeting_type, date)
+            flush_sessions(sessions_by_sid.pop(request.sid, set()) | {session_key})
+
             # Start celery worker
             try:
                 do_file_conversions.delay(attendees_info, meeting_type, meeting_name, duration, date, org_name=org_name, org_id=org_id)
@@ -1,18 +1,27 @@
-from celery import Celery
+from celery import Celery, chain
 import os
 import shutil
+import tempfile
 import logging
 import time
+import random
 from celery.signals import worker_shutdown
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import boto3
-from app.utils.openAI import transcribe_webm, transcribe_mp4, summarize_meeting_improved
-from app.utils.JoinTranscriptions import combine_text_files, json_to_word
-from app.utils.s3_utils import upload_file_to_s3, download_file, list_files, delete_from_s3
+from openai import RateLimitError, BadRequestError
+from app.utils.openAI import transcribe_webm_bytes, transcribe_audio_bytes, split_mp4_audio, summarize_meeting_improved
+from app.utils.JoinTranscriptions import json_to_word, natural_sort_key
+from app.utils.s3_utils import read_object_bytes, list_files, delete_from_s3
 from app.utils.Emails import send_email_to_user
+from app.utils.audio_ingest import is_bundle, unpack_chunks
+from app.utils.mongo import (build_session_key, mark_recording_processed, get_pipeline_run, open_pipeline_run,
+                             complete_pipeline_stage, record_pipeline_progress, fail_pipeline_run,
+                             finish_pipeline_run, get_failed_pipeline_runs, get_pipeline_meeting)
 from dotenv import load_dotenv
-from moviepy.editor import VideoFileClip
+from app.utils.media_probe import probe_duration, format_duration
 from app.models import Organization, User, BotRecord, db
 import json
+from io import BytesIO
 import re
 import requests
 from datetime import datetime
@@ -25,17 +34,58 @@ logger = logging.getLogger(__name__)
 
 app = Celery('tasks', broker=os.getenv("CLOUDAMQP_URL"))
 
+# Scratch space is a fresh temporary folder per call, but running several
+# meetings at once in one worker has not been load tested, so concurrency
+# stays at one unless CELERY_WORKER_CONCURRENCY raises it. Prefetching stays
+# at one because tasks are long and uneven in length.
+WORKER_CONCURRENCY = int(os.getenv("CELERY_WORKER_CONCURRENCY", 1))
+
 app.conf.update(broker_connection_retry_on_startup=True,
                 broker_pool_limit=1,
-                worker_concurrency=1,
+                worker_concurrency=WORKER_CONCURRENCY,
                 timezone="UTC",
                 enable_utc=True, 
                 task_serializer="json",
                 prefetch_multiplier=1,
                 worker_cancel_long_running_tasks_on_connection_loss=True)
 
+# Meetings are processed in stages, each persisting its output so a failed
+# run resumes from the stage that failed
+PIPELINE_STAGES = ["ingest", "transcribe", "merge", "summarize", "render", "notify", "archive"]
+PIPELINE_MAX_RETRIES = int(os.getenv("PIPELINE_MAX_RETRIES", 3))
+PIPELINE_RETRY_BACKOFF = int(os.getenv("PIPELINE_RETRY_BACKOFF", 30))
+
+# S3 prefix for objects that only live as long as a pipeline run
+PIPELINE_PREFIX = "pipeline"
+
+# Transcription and summarization get their own queues so they can be given
+# dedicated workers later; for now the main worker consumes them along with
+# the lighter stages on the "pipeline" queue.
+# Recall ingest does CPU-bound media work (ffmpeg, numpy), so launch_pipeline
+# sends it to MEDIA_QUEUE instead, served by a prefork worker where it cannot
+# block the green threads of the eventlet workers.
+MEDIA_QUEUE = "media"
+
+app.conf.task_routes = {
+    "app.tasks.ingest_stage": {"queue": "pipeline"},
+    "app.tasks.transcribe_stage": {"queue": "transcription"},
+    "app.tasks.merge_stage": {"queue": "pipeline"},
+    "app.tasks.summarize_stage": {"queue": "summarization"},
+    "app.tasks.render_stage": {"queue": "pipeline"},
+    "app.tasks.notify_stage": {"queue": "pipeline"},
+    "app.tasks.archive_stage": {"queue": "pipeline"}
+}
+
 BUCKET_NAME = os.getenv('BUCKETEER_BUCKET_NAME')
 
+# Number of chunks downloaded and transcribed at once, and retry policy per chunk
+TRANSCRIPTION_CONCURRENCY = int(os.getenv("TRANSCRIPTION_CONCURRENCY", 8))
+TRANSCRIPTION_MAX_RETRIES = int(os.getenv("TRANSCRIPTION_MAX_RETRIES", 3))
+TRANSCRIPTION_RETRY_BACKOFF = float(os.getenv("TRANSCRIPTION_RETRY_BACKOFF", 2))
+
+# Rate limits clear up on their own, so they get more attempts
+TRANSCRIPTION_RATE_LIMIT_RETRIES = int(os.getenv("TRANSCRIPTION_RATE_LIMIT_RETRIES", 6))
+
 # Connect to S3 bucketeer
 s3_client = boto3.client(
     's3',
@@ -67,20 +117,138 @@ def safe_delete_folder(folder_path, retries=3, delay=5):
 
 def get_video_duration(video_filepath):
     try:
-        clip = VideoFileClip(video_filepath)
-        duration = int(clip.duration)  # duration in seconds
-        clip.close()
-
-        hours = duration // 3600
-        minutes = (duration % 3600) // 60
-        seconds = duration % 60
-
-        formatted_duration = f"{hours}h {minutes}m {seconds}s"
-        return formatted_duration
+        return format_duration(probe_duration(video_filepath))
     except Exception as e:
         logger.error(f"Error getting duration of video {video_filepath}: {e}")
         return "0h 0m 0s"
 
+def retry_delay(error, attempt):
+    """
+    Exponential backoff with jitter, waiting at least as long as the API's
+    Retry-After header when rate limited.
+    """
+
+    delay = TRANSCRIPTION_RETRY_BACKOFF * 2 ** (attempt - 1)
+
+    if isinstance(error, RateLimitError):
+        try:
+            delay = max(delay, float(error.response.headers.get("retry-after")))
+        except (TypeError, ValueError):
+            pass
+
+    return delay + random.uniform(0, TRANSCRIPTION_RETRY_BACKOFF)
+
+def with_retries(description, func, *args):
+    """
+    Call func, retrying failures with exponential backoff. A ValueError or a
+    BadRequestError (the API rejected the input) can never succeed, so they
+    are raised straight away.
+    """
+
+    attempt = 0
+
+    while True:
+        attempt += 1
+
+        try:
+            return func(*args)
+
+        except (ValueError, BadRequestError):
+            raise
+
+        except Exception as e:
+            max_attempts = TRANSCRIPTION_RATE_LIMIT_RETRIES if isinstance(e, RateLimitError) else TRANSCRIPTION_MAX_RETRIES
+            if attempt >= max_attempts:
+                raise
+
+            delay = retry_delay(e, attempt)
+            logger.warning(f"Attempt {attempt} to {description} failed: {e}. Retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+def transcribe_chunk(item):
+    """
+    Stream one S3 object into Whisper. The object is either a single audio
+    chunk or a bundle of consecutive webm chunks, so a list of transcripts is
+    returned in chunk order, with None for chunks that are too short or that
+    the API rejects. Any other failure is raised once its retries are used up.
+    """
+
+    audio_bytes = with_retries(f"read {item}", read_object_bytes, item)
+    logger.info(f"Read file: {item}")
+
+    if is_bundle(item):
+        chunks = unpack_chunks(audio_bytes)
+    else:
+        chunks = [(item.split("_")[-1], audio_bytes)]
+
+    transcripts = []
+
+    for file, chunk_bytes in chunks:
+        # Browser chunks may need re-encoding, audio split from videos does not
+        transcribe = transcribe_webm_bytes if file.endswith(".webm") else transcribe_audio_bytes
+
+        try:
+            text = with_retries(f"transcribe {item}/{file}", transcribe, chunk_bytes, file)
+            logger.info(f"Successfully transcribed file: {item}/{file} into text.")
+        except ValueError as ve:
+            # Too short to transcribe, or no speech in it
+            logger.info(f"Skipping {item}/{file}: {ve}")
+            text = None
+        except BadRequestError as e:
+            # A chunk the API will never accept, e.g. one that could not be
+            # normalized at ingest. Losing it beats failing the meeting.
+            logger.warning(f"Skipping {item}/{file}, rejected by the API: {e}")
+            text = None
+
+        transcripts.append(text)
+
+    return transcripts
+
+def transcribe_chunks(files, completed=None, on_transcribed=None):
+    """
+    Transcribe S3 objects in parallel with a bounded pool. Transcripts are
+    returned in natural_sort_key order of the chunk keys.
+
+    Objects already in completed (key -> transcripts) are not transcribed
+    again, and on_transcribed(key, transcripts) is called as each object
+    finishes, so a retry only redoes the objects that failed. Raises if any
+    object could not be transcribed.
+    """
+
+    completed = dict(completed or {})
+    files = sorted(files, key=natural_sort_key)
+    pending = [item for item in files if item not in completed]
+    workers = max(1, min(TRANSCRIPTION_CONCURRENCY, len(pending)))
+
+    start = time.perf_counter()
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(transcribe_chunk, item): item for item in pending}
+
+        for future in as_completed(futures):
+            item = futures[future]
+
+            try:
+                completed[item] = future.result()
+            except Exception as e:
+                logger.error(f"Failed to transcribe {item}: {e}")
+                failed.append(item)
+                continue
+
+            if on_transcribed:
+                on_transcribed(item, completed[item])
+
+    if failed:
+        raise RuntimeError(f"Failed to transcribe {len(failed)} of {len(files)} objects, first: {failed[0]}")
+
+    transcripts = [text for item in files for text in completed[item]]
+
+    num_transcribed = len([text for text in transcripts if text is not None])
+    logger.info(f"Transcribed {num_transcribed}/{len(transcripts)} chunks from {len(pending)} objects with {workers} workers in {time.perf_counter() - start:.1f}s.")
+
+    return transcripts
+
 @app.task
 def dummy_task():
     # Write a function that writes out a text file
@@ -88,325 +256,431 @@ def dummy_task():
         f.write("This is a dummy task.")
     logger.info("Dummy task executed.")
 
-@app.task
-def do_file_conversions(attendees_info, meeting_type, meeting_name, meeting_duration, date, org_name, org_id):
+def recording_params(attendees_info, meeting_type, meeting_name, meeting_duration, date, org_name, org_id):
+    """
+    Everything the pipeline stages need to process a recorded meeting.
+    """
 
-    logger.info("ARGS:\n")
-    logger.info("Attendees: " + str(attendees_info))
-    logger.info("Meeting Type: " + str(meeting_type))
-    logger.info("Meeting Name: " + str(meeting_name))
-    logger.info("Meeting Duration: " + str(meeting_duration))
-    logger.info("Date: " + str(date))
-    logger.info("Org Name: " + str(org_name))
-    logger.info("Org ID: " + str(org_id))
+    manager_info = attendees_info[0]
 
-    emails = [person_info["email"] for person_info in attendees_info]
+    username = f"{manager_info['first_name']} {manager_info['last_name']}"
 
     if meeting_type == "One-on-One":
-        manager_info, report_info = attendees_info
-
-        user_id = manager_info["user_id"]
+        report_info = attendees_info[1]
 
         meeting_title = f"{meeting_type} Meeting with {manager_info['first_name']} {manager_info['last_name']} and {report_info['first_name']} {report_info['last_name']} on {date}"
         report = f"{report_info['first_name']}{report_info['last_name']}"
 
-        username = f"{manager_info['first_name']} {manager_info['last_name']}"
-        
-        filepath_to_convert = os.path.join(username, report, date)
-        print("Filepath to convert", filepath_to_convert)
-        filepath_to_convert = filepath_to_convert.replace("\\", "_")
-        filepath_to_convert = filepath_to_convert.replace("/", "_")
+    else:
+        meeting_title = f"{meeting_type} hosted by {manager_info['first_name']} {manager_info['last_name']} on {date}"
+        report = meeting_type
+
+    audio_prefix = os.path.join(username, report, date)
+    audio_prefix = audio_prefix.replace("\\", "_")
+    audio_prefix = audio_prefix.replace("/", "_")
+
+    return {
+        "attendees": attendees_info,
+        "emails": [person_info["email"] for person_info in attendees_info],
+        "meeting_type": meeting_type,
+        "meeting_name": meeting_name,
+        "meeting_duration": meeting_duration,
+        "meeting_title": meeting_title,
+        "date": date,
+        "org_name": org_name,
+        "org_id": org_id,
+        "user_id": manager_info["user_id"],
+        "username": username,
+        "audio_prefix": audio_prefix,
+        "session_key": build_session_key(username, report, date),
+        "output_file": f"{username}_{report}_{date}.txt"
+    }
+
+def recall_params(bot_id, video_url, meeting_type, user, org, meeting_name):
+    """
+    Everything the pipeline stages need to process a Recall bot recording.
+    """
+
+    # Sanitize names for use in file names
+    def sanitize_filename(s):
+        return re.sub(r'[<>:"/\\|?*]', '_', s)
+
+    username = sanitize_filename(f"{user['first_name']} {user['last_name']}")
+    meeting_name_sanitized = sanitize_filename(meeting_name)
+    date = datetime.now().strftime('%Y-%m-%d')
+
+    return {
+        "bot_id": bot_id,
+        "video_url": video_url,
+        "attendees": [user],
+        "emails": [user["email"]],
+        "meeting_type": meeting_type,
+        "meeting_name": meeting_name_sanitized,
+        "meeting_title": f"{meeting_name_sanitized} on {date}",
+        "date": date,
+        "org_name": org["name"],
+        "org_id": org["org_id"],
+        "user_id": user["user_id"],
+        "username": username,
+        "output_file": f"{username}_{meeting_name_sanitized}_{date}.txt"
+    }
+
+def stage_output(run, stage):
+    return run["stages"][stage]["output"]
+
+def ingest(run):
+    """
+    Find the meeting's audio in S3. Recall videos are downloaded, split into
+    audio chunks and uploaded, so the transcribe stage can treat both kinds
+    of meeting the same way. Recall ingest runs on the media queue.
+    """
+
+    params = run["params"]
+
+    if run["kind"] == "recall":
+        scratch_folder = tempfile.mkdtemp(prefix="recall_")
 
-        logger.info(f"Starting file process for path: {filepath_to_convert}")
-        
         try:
-            files = list_files(BUCKET_NAME, filepath_to_convert)
-            logger.info(f"Found {len(files)} files to process.")
-
-            if len(files) != 0:
-
-                for item in files:
-                    user, report, date, file = item.split("_")
-
-                    # Download the file
-                    download_file(BUCKET_NAME, item, user, report, date, file)
-                    logger.info(f"Downloaded file: {item}")
-
-                    # Process the file (convert to .wav)
-                    temp_download_folder = os.path.join(f"tmp_{username}", "downloaded_webm_file")
-                    temp_transcribed_folder = os.path.join(f"tmp_{username}", "transcribed_chunks")
-                    
-                    full_webm_path = os.path.join(temp_download_folder, user, report, date, file)
-                    
-                    try:
-                        transcribe_webm(full_webm_path, username)
-                        print(f"Successfully transcribed file: {item} into text.")
-
-                    except ValueError as ve:
-                        print(f"Skipping {item}: {ve}")
-
-                input_folder = os.path.join(f"tmp_{username}", "transcribed_chunks", username, report, date)
-                output_file = f"{username}_{report}_{date}.txt"
-                combine_text_files(input_folder, output_file, username)
-                logger.info(f"Successfully combined all text file in {input_folder} into {output_file}")
-
-                raw_text_path = os.path.join(f"tmp_{username}", "joined_text", output_file)
-                # summarize_meeting(raw_text_path, output_file, username)
-                print("Arguments for summarizing meeting: ", raw_text_path, output_file, username, org_name, org_id, meeting_type)
-                json_data = summarize_meeting_improved(raw_text_path, output_file, username, org_name, org_id, meeting_type, meeting_name, user_id, attendees_info, meeting_duration)
-                logger.info(f"JSON DATA: {json_data}")
-                logger.info(f"Successfully summarized: {raw_text_path}.")
-
-                summarized_meeting_path = os.path.join(f"tmp_{username}", "summarized_meeting", output_file)
-                # word_doc_path = summary_to_word_doc(summarized_meeting_path, username)
-                word_doc_path = json_to_word(summarized_meeting_path, username, json_data, meeting_title)
-                logger.info(f"Successfully turned: {summarized_meeting_path} into a word document.")
-
-                print("Sending email")
-
-                for email in emails:
-                    send_email_to_user(word_doc_path, meeting_title, email)
-
-                # Upload raw text to S3
-                upload_path = "Transcription_" + output_file
-                upload_file_to_s3(raw_text_path, upload_path)
-                logger.info(f"Successfully uploaded: {raw_text_path} to S3 as {upload_path}.")
-
-                # Upload summarized text to S3
-                upload_path = "Summary_" + output_file
-                upload_file_to_s3(summarized_meeting_path, upload_path)
-                logger.info(f"Successfully uploaded: {summarized_meeting_path} to S3 as {upload_path}.")
-
-                # Safely try deleting folder
-                logger.info(f"Attempting to delete tmp_{username} folder:")
-                safe_delete_folder(f"tmp_{username}")
-                logger.info(f"Successfully deleted tmp_{username} folder.")
-
-                # Destroy audio files in S3 bucket
-                logger.info(f"Attempting to delete audio files from bucket:")
-                delete_from_s3(files)
-                logger.info(f"Successfully deleted audio files from bucket.")
+            video_filepath = os.path.join(scratch_folder, f"{params['bot_id']}.mp4")
 
-        except Exception as e:
-            logger.error(f"Error during file conversion process: {e}")
+            # Download the video from the 'video_url' in chunks
+            video_response = requests.get(params["video_url"], stream=True, timeout=60)
+            video_response.raise_for_status()
 
-    else:
+            with open(video_filepath, 'wb') as f:
+                for chunk in video_response.iter_content(chunk_size=8192):
+                    if chunk:
+                        f.write(chunk)
 
-        manager_info = attendees_info[0]
+            logger.info(f"Video for bot {params['bot_id']} downloaded to {video_filepath}")
 
-        user_id = manager_info["user_id"]
+            files = []
+            for chunk_path in split_mp4_audio(video_filepath):
+                chunk_key = f"{PIPELINE_PREFIX}/{run['_id']}/{os.path.basename(chunk_path)}"
+                s3_client.upload_file(chunk_path, BUCKET_NAME, chunk_key)
+                files.append(chunk_key)
 
-        meeting_title = f"{meeting_type} hosted by {manager_info['first_name']} {manager_info['last_name']} on {date}"
-        report = meeting_type
+            return {"files": files, "meeting_duration": get_video_duration(video_filepath)}
 
-        username = f"{manager_info['first_name']} {manager_info['last_name']}"
-        
-        filepath_to_convert = os.path.join(username, report, date)
-        filepath_to_convert = filepath_to_convert.replace("\\", "_")
-        filepath_to_convert = filepath_to_convert.replace("/", "_")
+        finally:
+            safe_delete_folder(scratch_folder)
 
-        logger.info(f"Starting file process for path: {filepath_to_convert}")
-        
-        try:
-            files = list_files(BUCKET_NAME, filepath_to_convert)
-            logger.info(f"Found {len(files)} files to process.")
+    files = list_files(BUCKET_NAME, params["audio_prefix"])
+    logger.info(f"Found {len(files)} files to process.")
 
-            if len(files) != 0:
+    if not files:
+        raise ValueError(f"No audio found in S3 for {params['audio_prefix']}")
 
-                for item in files:
-                    user, report, date, file = item.split("_")
+    return {"files": files}
 
-                    # Download the file
-                    download_file(BUCKET_NAME, item, user, report, date, file)
-                    logger.info(f"Downloaded file: {item}")
+def transcribe(run):
+    """
+    Transcribe the ingested audio. Chunks are streamed from S3 into Whisper in
+    parallel, keeping the transcripts in chunk order. Each finished object is
+    recorded, so a retried stage picks up where the last attempt stopped.
+    """
 
-                    # Process the file (convert to .wav)
-                    temp_download_folder = os.path.join(f"tmp_{username}", "downloaded_webm_file")
-                    temp_transcribed_folder = os.path.join(f"tmp_{username}", "transcribed_chunks")
-                    
-                    full_webm_path = os.path.join(temp_download_folder, user, report, date, file)
-                    try:
-                        transcribe_webm(full_webm_path, username)
-                        print(f"Successfully transcribed file: {item} into text.")
+    # Objects transcribed by an earlier attempt of this stage
+    completed = {entry["item"]: entry["transcripts"] for entry in run.get("progress", {}).get("transcribe", [])}
 
-                    except ValueError as ve:
-                        print(f"Skipping {item}: {ve}")
+    def on_transcribed(item, transcripts):
+        record_pipeline_progress(run["_id"], "transcribe", {"item": item, "transcripts": transcripts})
 
+    transcripts = transcribe_chunks(stage_output(run, "ingest")["files"], completed, on_transcribed)
 
-                input_folder = os.path.join(f"tmp_{username}", "transcribed_chunks", username, report, date)
-                output_file = f"{username}_{report}_{date}.txt"
-                combine_text_files(input_folder, output_file, username)
-                logger.info(f"Successfully combined all text file in {input_folder} into {output_file}")
+    if all(text is None for text in transcripts):
+        raise RuntimeError(f"None of the {len(transcripts)} chunks for {run['_id']} could be transcribed")
 
-                raw_text_path = os.path.join(f"tmp_{username}", "joined_text", output_file)
-                # summarize_meeting(raw_text_path, output_file, username)
-                print("Arguments for summarizing meeting: ", raw_text_path, output_file, username, org_name, org_id, meeting_type)
-                json_data = summarize_meeting_improved(raw_text_path, output_file, username, org_name, org_id, meeting_type, meeting_name, user_id, attendees_info, meeting_duration)
-                logger.info(f"Successfully summarized: {raw_text_path}.")
+    return {"transcripts": transcripts}
 
-                summarized_meeting_path = os.path.join(f"tmp_{username}", "summarized_meeting", output_file)
-                # word_doc_path = summary_to_word_doc(summarized_meeting_path, username)
-                word_doc_path = json_to_word(summarized_meeting_path, username, json_data, meeting_title)
-                logger.info(f"Successfully turned: {summarized_meeting_path} into a word document.")
+def merge(run):
+    transcripts = stage_output(run, "transcribe")["transcripts"]
 
-                print("Sending email")
+    return {"raw_text": "".join(f"{text}\n" for text in transcripts if text is not None)}
 
-                for email in emails:
-                    send_email_to_user(word_doc_path, meeting_title, email)
+def summarize(run):
+    """
+    Summarize the transcript. This also saves the meeting to the org's
+    database, keyed on the run id. If an earlier attempt already saved it,
+    its summary is reused instead of calling the model again.
+    """
 
-                # Upload raw text to S3
-                upload_path = "Transcription_" + output_file
-                upload_file_to_s3(raw_text_path, upload_path)
-                logger.info(f"Successfully uploaded: {raw_text_path} to S3 as {upload_path}.")
+    params = run["params"]
 
-                # Upload summarized text to S3
-                upload_path = "Summary_" + output_file
-                upload_file_to_s3(summarized_meeting_path, upload_path)
-                logger.info(f"Successfully uploaded: {summarized_meeting_path} to S3 as {upload_path}.")
+    existing = get_pipeline_meeting(params["org_name"], run["_id"])
+    if existing:
+        logger.info(f"Meeting for {run['_id']} was already saved, reusing its summary.")
+        return {"summary": existing["summary"]}
 
-                # Safely try deleting folder
-                logger.info(f"Attempting to delete tmp_{username} folder:")
-                safe_delete_folder(f"tmp_{username}")
-                logger.info(f"Successfully deleted tmp_{username} folder.")
+    meeting_duration = stage_output(run, "ingest").get("meeting_duration", params.get("meeting_duration"))
 
-                # Destroy audio files in S3 bucket
-                logger.info(f"Attempting to delete audio files from bucket:")
-                delete_from_s3(files)
-                logger.info(f"Successfully deleted audio files from bucket.")
+    json_data = summarize_meeting_improved(stage_output(run, "merge")["raw_text"], params["output_file"], params["username"],
+                                           params["org_name"], params["org_id"], params["meeting_type"], params["meeting_name"],
+                                           params["user_id"], params["attendees"], meeting_duration, pipeline_run_id=run["_id"])
 
-        except Exception as e:
-            logger.error(f"Error during file conversion process: {e}")
+    if json_data is None:
+        raise RuntimeError(f"Failed to summarize {params['output_file']}")
 
+    logger.info(f"Successfully summarized: {params['output_file']}.")
+    return {"summary": json_data}
+
+def render(run):
+    """
+    Turn the summary into a Word document, kept in S3 until the run is archived.
+    """
+
+    params = run["params"]
+    word_folder = tempfile.mkdtemp(prefix="word_summary_")
 
-@app.task
-def process_recall_video(video_filepath, bot_id, video_url, meeting_type, user, org, meeting_name):
     try:
+        word_doc_path = json_to_word(params["output_file"], params["username"], stage_output(run, "summarize")["summary"],
+                                     word_folder, params["meeting_title"])
 
-        video_filename = f"{bot_id}.mp4"
-        video_filepath = os.path.join("videos", video_filename)  # Ensure 'videos' directory exists
+        document_key = f"{PIPELINE_PREFIX}/{run['_id']}/{os.path.basename(word_doc_path)}"
+        s3_client.upload_file(word_doc_path, BUCKET_NAME, document_key)
 
-        # Create the 'videos' directory if it doesn't exist
-        os.makedirs(os.path.dirname(video_filepath), exist_ok=True)
+    finally:
+        safe_delete_folder(word_folder)
 
+    logger.info(f"Successfully turned the summary of {params['output_file']} into a word document.")
+    return {"document_key": document_key}
 
-        # Download the video from the 'video_url'
-        video_response = requests.get(video_url, stream=True)
+def notify(run):
+    """
+    Email the Word document to every attendee. Each address is recorded once
+    it is sent, so a retry only emails the attendees that were missed.
+    """
 
-        # Download and save the video file in chunks
-        with open(video_filepath, 'wb') as f:
-            for chunk in video_response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+    params = run["params"]
+    document_key = stage_output(run, "render")["document_key"]
+    already_sent = set(run.get("progress", {}).get("notify", []))
 
-        print(f"Video for bot {bot_id} downloaded and saved as {video_filepath}")
+    word_folder = tempfile.mkdtemp(prefix="word_summary_")
 
-        logger.info(f"Processing video for bot {bot_id}")
+    try:
+        word_doc_path = os.path.join(word_folder, os.path.basename(document_key))
+        s3_client.download_file(BUCKET_NAME, document_key, word_doc_path)
+
+        for email in params["emails"]:
+            if email in already_sent:
+                continue
+
+            send_email_to_user(word_doc_path, params["meeting_title"], email)
+            record_pipeline_progress(run["_id"], "notify", email)
+
+    finally:
+        safe_delete_folder(word_folder)
+
+    return {"emails": params["emails"]}
+
+def archive(run):
+    """
+    Upload the transcript and summary, then delete the audio and the run's
+    scratch objects from S3. Uploads raise on failure, so the stage is
+    retried before anything is deleted.
+    """
+
+    params = run["params"]
+
+    # Upload raw text to S3
+    transcript_key = "Transcription_" + params["output_file"]
+    s3_client.upload_fileobj(BytesIO(stage_output(run, "merge")["raw_text"].encode("utf-8")), BUCKET_NAME, transcript_key)
+    logger.info(f"Successfully uploaded transcript to S3 as {transcript_key}.")
+
+    # Upload summarized text to S3
+    summary_key = "Summary_" + params["output_file"]
+    s3_client.upload_fileobj(BytesIO(json.dumps(stage_output(run, "summarize")["summary"]).encode("utf-8")), BUCKET_NAME, summary_key)
+    logger.info(f"Successfully uploaded summary to S3 as {summary_key}.")
+
+    # Destroy audio files and the Word document in S3 bucket
+    logger.info(f"Attempting to delete audio files from bucket:")
+    delete_from_s3(stage_output(run, "ingest")["files"] + [stage_output(run, "render")["document_key"]])
+    logger.info(f"Successfully deleted audio files from bucket.")
+
+    if run["kind"] == "recording":
+        # Keep the session in the recording index for duplicate checks
+        mark_recording_processed(params["session_key"])
+
+    return {"transcript_key": transcript_key, "summary_key": summary_key}
+
+def run_stage(run_id, stage, func):
+    """
+    Run one stage of a pipeline run and persist its output. Stages that
+    already completed are skipped, which is what makes a resumed run pick up
+    where it failed.
+    """
+
+    run = get_pipeline_run(run_id)
+
+    if stage in run["stages"]:
+        logger.info(f"Skipping {stage} for {run_id}, it already completed.")
+        return run_id
+
+    start = time.perf_counter()
+    complete_pipeline_stage(run_id, stage, func(run))
+    logger.info(f"Completed {stage} for {run_id} in {time.perf_counter() - start:.1f}s.")
+
+    if stage == PIPELINE_STAGES[-1]:
+        finish_pipeline_run(run_id)
+        logger.info(f"End-to-end latency for {run['params']['meeting_title']}: {(datetime.utcnow() - run['created_at']).total_seconds():.1f}s.")
+
+    return run_id
+
+class PipelineStageTask(app.Task):
+    """
+    Base task for pipeline stages. Once a stage has used up its retries the
+    run is marked failed at that stage, ready to be resumed.
+    """
+
+    stage = None
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        logger.error(f"Stage {self.stage} failed for {args[0]}: {exc}")
+        fail_pipeline_run(args[0], self.stage, str(exc))
+
+# Redelivered if a worker dies mid-stage, and retried with backoff. A
+# ValueError means the input can never succeed, so it is not retried.
+STAGE_OPTIONS = dict(
+    base=PipelineStageTask,
+    acks_late=True,
+    autoretry_for=(Exception,),
+    dont_autoretry_for=(ValueError,),
+    max_retries=PIPELINE_MAX_RETRIES,
+    retry_backoff=PIPELINE_RETRY_BACKOFF,
+    retry_jitter=True
+)
 
-        org_name = org["name"]
+@app.task(stage="ingest", **STAGE_OPTIONS)
+def ingest_stage(run_id):
+    return run_stage(run_id, "ingest", ingest)
 
-        # Function to sanitize filenames and directory names
-        def sanitize_filename(s):
-            return re.sub(r'[<>:"/\\|?*]', '_', s)
+@app.task(stage="transcribe", **STAGE_OPTIONS)
+def transcribe_stage(run_id):
+    return run_stage(run_id, "transcribe", transcribe)
 
-        # Sanitize 'username' and 'meeting_name' for use in file paths
-        username = sanitize_filename(f"{user['first_name']} {user['last_name']}")
-        meeting_name_sanitized = sanitize_filename(meeting_name)
-        date = datetime.now().strftime('%Y-%m-%d')
+@app.task(stage="merge", **STAGE_OPTIONS)
+def merge_stage(run_id):
+    return run_stage(run_id, "merge", merge)
 
-        # Create a temporary working directory
-        tmp_folder = f"tmp_{username}"
-        os.makedirs(tmp_folder, exist_ok=True)
+@app.task(stage="summarize", **STAGE_OPTIONS)
+def summarize_stage(run_id):
+    return run_stage(run_id, "summarize", summarize)
 
-        # Copy the video file into the temporary directory
-        video_folder = os.path.join(tmp_folder, 'video_files')
-        os.makedirs(video_folder, exist_ok=True)
-        video_filename = os.path.basename(video_filepath)
-        tmp_video_filepath = os.path.join(video_folder, video_filename)
+@app.task(stage="render", **STAGE_OPTIONS)
+def render_stage(run_id):
+    return run_stage(run_id, "render", render)
 
-        shutil.copy2(video_filepath, tmp_video_filepath)
-        logger.info(f"Copied video file to {tmp_video_filepath}")
+@app.task(stage="notify", **STAGE_OPTIONS)
+def notify_stage(run_id):
+    return run_stage(run_id, "notify", notify)
 
-        # Now, use the video file from the temporary directory
-        # Transcribe the MP4 file
-        transcription_text = transcribe_mp4(tmp_video_filepath)
+@app.task(stage="archive", **STAGE_OPTIONS)
+def archive_stage(run_id):
+    return run_stage(run_id, "archive", archive)
 
-        if not transcription_text:
-            logger.error(f"No transcription text obtained for video {tmp_video_filepath}")
-            return
+STAGE_TASKS = {
+    "ingest": ingest_stage,
+    "transcribe": transcribe_stage,
+    "merge": merge_stage,
+    "summarize": summarize_stage,
+    "render": render_stage,
+    "notify": notify_stage,
+    "archive": archive_stage
+}
 
-        # Save transcription text to a file within the temporary directory
-        output_filename = f"{username}_{meeting_name_sanitized}_{date}.txt"
-        transcription_folder = os.path.join(tmp_folder, 'transcribed_chunks', username, meeting_name_sanitized, date)
-        os.makedirs(transcription_folder, exist_ok=True)
-        transcription_filepath = os.path.join(transcription_folder, output_filename)
+def launch_pipeline(run_id):
+    """
+    Chain the stages a run has not completed yet. Each stage is routed to
+    its own queue by task_routes, except Recall ingest, which goes to the
+    media queue.
+    """
 
-        with open(transcription_filepath, 'w', encoding='utf-8') as f:
-            f.write(transcription_text)
+    run = get_pipeline_run(run_id)
+    remaining = [stage for stage in PIPELINE_STAGES if stage not in run["stages"]]
 
-        logger.info(f"Transcription saved to {transcription_filepath}")
+    if not remaining:
+        finish_pipeline_run(run_id)
+        return
 
-        # Prepare raw text path
-        raw_text_folder = os.path.join(tmp_folder, 'joined_text')
-        os.makedirs(raw_text_folder, exist_ok=True)
-        raw_text_path = os.path.join(raw_text_folder, output_filename)
-        shutil.copyfile(transcription_filepath, raw_text_path)
+    logger.info(f"Launching {' -> '.join(remaining)} for {run_id}")
 
-        # Generate meeting summary
-        meeting_duration = get_video_duration(tmp_video_filepath)
-        json_data = summarize_meeting_improved(
-            raw_text_path,
-            output_filename,
-            username,
-            org_name,
-            org["org_id"],
-            type_name=meeting_type,
-            meeting_name=meeting_name_sanitized,
-            user_id=user["user_id"],
-            attendees=[user],  # Assuming attendees_info expects a list
-            meeting_duration=meeting_duration
-        )
+    signatures = [STAGE_TASKS[stage].s() for stage in remaining]
+    signatures[0] = STAGE_TASKS[remaining[0]].s(run_id)
 
-        # Save the summary JSON data within the temporary directory
-        summarized_meeting_folder = os.path.join(tmp_folder, 'summarized_meeting')
-        os.makedirs(summarized_meeting_folder, exist_ok=True)
-        summarized_meeting_filepath = os.path.join(summarized_meeting_folder, output_filename.replace('.txt', '.json'))
+    if remaining[0] == "ingest" and run["kind"] == "recall":
+        signatures[0] = signatures[0].set(queue=MEDIA_QUEUE)
 
-        with open(summarized_meeting_filepath, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, indent=2)
+    chain(*signatures).apply_async()
 
-        logger.info(f"Meeting summary saved to {summarized_meeting_filepath}")
+def start_pipeline(run_id, kind, params, force=False):
+    """
+    Start processing a meeting. A run that already finished is not processed
+    again, and one still in progress is left alone unless force is set.
+    """
 
-        # Generate Word document from the summary
-        meeting_title = f"{meeting_name_sanitized} on {date}"
-        word_doc_path = json_to_word(summarized_meeting_filepath, username, json_data, meeting_title)
+    run = get_pipeline_run(run_id)
 
-        logger.info(f"Word document created at {word_doc_path}")
+    if run and run["status"] == "done":
+        logger.info(f"Pipeline run {run_id} already finished, skipping.")
+        return
 
-        # Send email to the user with the Word document
-        send_email_to_user(word_doc_path, meeting_title, user["email"])
+    if run and run["status"] == "running" and not force:
+        logger.info(f"Pipeline run {run_id} is already in progress, skipping.")
+        return
 
-        logger.info(f"Email sent to {user['email']} with the meeting summary")
+    open_pipeline_run(run_id, kind, params)
+    launch_pipeline(run_id)
 
-        # Upload raw text to S3
-        upload_path = "Transcription_" + output_filename
-        upload_file_to_s3(raw_text_path, upload_path)
-        logger.info(f"Successfully uploaded: {raw_text_path} to S3 as {upload_path}.")
+@app.task
+def resume_pipeline(run_id):
+    """
+    Resume a run from its first incomplete stage.
+    """
 
-        # Upload summarized text to S3
-        upload_path = "Summary_" + output_filename
-        upload_file_to_s3(summarized_meeting_filepath, upload_path)
-        logger.info(f"Successfully uploaded: {summarized_meeting_filepath} to S3 as {upload_path}.")
+    run = get_pipeline_run(run_id)
 
-        # Clean up the temporary working directory
-        logger.info(f"Attempting to delete {tmp_folder} folder:")
-        safe_delete_folder(tmp_folder)
-        logger.info(f"Successfully deleted {tmp_folder} folder.")
-
-        # Optionally delete the original video file if no longer needed
-        # os.remove(video_filepath)
+    if run is None:
+        logger.error(f"No pipeline run {run_id} to resume.")
+        return
 
-    except Exception as e:
-        logger.error(f"Error processing video for bot {bot_id}: {e}")
+    start_pipeline(run_id, run["kind"], run["params"], force=True)
+
+@app.task
+def resume_failed_pipelines():
+    """
+    Resume every failed run, e.g. after an outage:
+    celery -A app.tasks call app.tasks.resume_failed_pipelines
+    """
+
+    for run in get_failed_pipeline_runs():
+        logger.info(f"Resuming {run['_id']}, which failed at {run.get('failed_stage')}: {run.get('error')}")
+        resume_pipeline(run["_id"])
+
+@app.task
+def do_file_conversions(attendees_info, meeting_type, meeting_name, meeting_duration, date, org_name, org_id):
+
+    logger.info("ARGS:\n")
+    logger.info("Attendees: " + str(attendees_info))
+    logger.info("Meeting Type: " + str(meeting_type))
+    logger.info("Meeting Name: " + str(meeting_name))
+    logger.info("Meeting Duration: " + str(meeting_duration))
+    logger.info("Date: " + str(date))
+    logger.info("Org Name: " + str(org_name))
+    logger.info("Org ID: " + str(org_id))
+
+    params = recording_params(attendees_info, meeting_type, meeting_name, meeting_duration, date, org_name, org_id)
+
+    logger.info(f"Starting file process for path: {params['audio_prefix']}")
+
+    start_pipeline(params["audio_prefix"], "recording", params)
+
+
+@app.task
+def process_recall_video(video_filepath, bot_id, video_url, meeting_type, user, org, meeting_name):
+
+    logger.info(f"Processing video for bot {bot_id}")
+
+    start_pipeline(f"recall_{bot_id}", "recall", recall_params(bot_id, video_url, meeting_type, user, org, meeting_name))
 
 @worker_shutdown.connect
 def worker_shutdown_handler(**kwargs):
@@ -0,0 +1,195 @@
+import os
+import zipfile
+import logging
+from io import BytesIO
+from threading import Lock
+from cachetools import TTLCache
+from app.utils.s3_utils import s3_client, bucket_name
+from app.utils.JoinTranscriptions import natural_sort_key
+
+# Number of consecutive browser chunks grouped into one S3 object
+CHUNKS_PER_OBJECT = int(os.getenv("AUDIO_CHUNKS_PER_OBJECT", 4))
+FLUSH_RETRIES = 3
+
+# session_key -> list of (chunk number, audio bytes) waiting to be uploaded
+buffers = {}
+
+# session_key -> batches of chunks whose upload failed. A batch is retried
+# as it is, never merged with newer chunks, so it keeps its S3 key and an
+# upload that landed despite the error is overwritten rather than duplicated.
+# Like buffers, this only lives in the web process, so audio not yet in S3
+# is lost if the process restarts.
+failed_batches = {}
+
+# session_key -> number of uploads currently running in the background
+in_flight = {}
+
+# session_key -> the webm header (EBML header, segment info and tracks) of
+# the session's first chunk. MediaRecorder only writes it once, later chunks
+# are bare clusters that need it prepended to be playable on their own.
+init_segments = TTLCache(maxsize=1024, ttl=6 * 3600)
+
+# Every webm file starts with the EBML header element, and each block of
+# audio in it is a Cluster element
+EBML_HEADER_ID = b"\x1a\x45\xdf\xa3"
+CLUSTER_ID = b"\x1f\x43\xb6\x75"
+
+lock = Lock()
+
+def pack_chunks(chunks):
+    """
+    Pack a list of (chunk number, audio bytes) into a single uncompressed zip
+    archive, one "<number>.webm" member per chunk.
+    """
+
+    archive = BytesIO()
+
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_STORED) as bundle:
+        for number, audio in chunks:
+            bundle.writestr(f"{number}.webm", audio)
+
+    archive.seek(0)
+    return archive
+
+def unpack_chunks(data):
+    """
+    Unpack a bundle written by pack_chunks into a list of (file name, audio
+    bytes), in chunk order.
+    """
+
+    with zipfile.ZipFile(BytesIO(data)) as bundle:
+        names = sorted(bundle.namelist(), key=natural_sort_key)
+        return [(name, bundle.read(name)) for name in names]
+
+def is_bundle(key):
+    return key.endswith(".zip")
+
+def has_webm_header(audio):
+    return audio[:4] == EBML_HEADER_ID
+
+def init_segment(audio):
+    """
+    The header part of a complete webm chunk, everything before its first
+    Cluster.
+    """
+
+    cluster = audio.find(CLUSTER_ID)
+    return audio[:cluster] if cluster > 0 else audio
+
+def normalize_chunks(session_key, chunks):
+    """
+    Make every chunk a standalone webm file by prepending the session's init
+    segment to continuation chunks, which start with a bare Cluster. Chunks
+    that are neither are kept as they are. The transcription stage skips them
+    when they cannot be decoded or Whisper rejects them.
+    """
+
+    with lock:
+        header = init_segments.get(session_key)
+
+    normalized = []
+    for number, audio in chunks:
+        if has_webm_header(audio):
+            pass
+        elif audio[:4] == CLUSTER_ID and header:
+            audio = header + audio
+        else:
+            logging.warning(f"Chunk {number} of {session_key} is not a webm file or continuation that can be fixed")
+        normalized.append((number, audio))
+
+    return normalized
+
+def add_chunk(session_key, number, audio):
+    """
+    Buffer a chunk for a session. Returns the chunks to upload once enough have
+    been collected, otherwise None.
+    """
+
+    with lock:
+        # Chunks arrive in order, so the first chunk with a header is the
+        # recording's init segment
+        if session_key not in init_segments and has_webm_header(audio):
+            init_segments[session_key] = init_segment(audio)
+
+        buffer = buffers.setdefault(session_key, [])
+        buffer.append((number, audio))
+
+        if len(buffer) < CHUNKS_PER_OBJECT:
+            return None
+
+        del buffers[session_key]
+        in_flight[session_key] = in_flight.get(session_key, 0) + 1
+        return buffer
+
+def take_remaining(session_key):
+    """
+    Remove and return whatever is still waiting to be uploaded for a
+    session, as a list of batches to flush one by one: first any batches
+    whose upload failed, then the chunks still buffered.
+    """
+
+    with lock:
+        batches = failed_batches.pop(session_key, [])
+        buffer = buffers.pop(session_key, [])
+        if buffer:
+            batches.append(buffer)
+        if batches:
+            in_flight[session_key] = in_flight.get(session_key, 0) + len(batches)
+        return batches
+
+def has_in_flight(session_key):
+    with lock:
+        return in_flight.get(session_key, 0) > 0
+
+def has_buffered(session_key):
+    with lock:
+        return bool(buffers.get(session_key) or failed_batches.get(session_key))
+
+def flush_chunks(session_key, chunks):
+    """
+    Upload buffered chunks as one S3 object. A single chunk is uploaded as a
+    plain webm file, several are grouped into a "<first>-<last>.zip" bundle.
+    Chunks are normalized first, so every uploaded chunk can be decoded on
+    its own. If every attempt fails the batch is kept in failed_batches, so
+    audio_end retries it under the same key. Returns whether the upload
+    succeeded.
+    """
+
+    uploaded = False
+
+    try:
+        normalized = normalize_chunks(session_key, sorted(chunks, key=lambda chunk: chunk[0]))
+
+        if len(normalized) == 1:
+            number, audio = normalized[0]
+            key = f"{session_key}_{number}.webm"
+            stream = BytesIO(audio)
+        else:
+            key = f"{session_key}_{normalized[0][0]}-{normalized[-1][0]}.zip"
+            stream = pack_chunks(normalized)
+
+        for attempt in range(1, FLUSH_RETRIES + 1):
+            try:
+                stream.seek(0)
+                s3_client.upload_fileobj(stream, bucket_name, key)
+                logging.info(f"Uploaded {len(normalized)} chunks for {session_key} as {key}")
+                uploaded = True
+                break
+            except Exception as e:
+                logging.error(f"Attempt {attempt} to upload {key} failed: {e}")
+
+        stream.close()
+
+    finally:
+        with lock:
+            # Put the chunks back before the upload stops counting as in
+            # flight, so anyone waiting on it sees them
+            if not uploaded:
+                logging.error(f"Keeping {len(chunks)} chunks for {session_key} to retry after failing to upload them")
+                failed_batches.setdefault(session_key, []).append(chunks)
+
+            in_flight[session_key] -= 1
+            if in_flight[session_key] <= 0:
+                del in_flight[session_key]
+
+    return uploaded
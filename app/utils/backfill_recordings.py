@@ -0,0 +1,51 @@
+import logging
+from app.utils.s3_utils import list_all_files, bucket_name
+from app.utils.mongo import backfill_recording_sessions
+
+def session_key_for(key):
+    """
+    The recording session an S3 key belongs to, with the status it implies,
+    or None for keys that are not recordings. Recordings made before the
+    session index left either a "Summary_<session>.txt" file or audio chunks
+    under "<username>/<report>/<date>/", and newer ones upload chunks as
+    "<session>_<n>.webm" or "<session>_<first>-<last>.zip".
+    """
+
+    if key.startswith("Summary_") and key.endswith(".txt"):
+        return key[len("Summary_"):-len(".txt")], "processed"
+
+    parts = key.split("/")
+    if len(parts) == 4 and parts[-1].endswith(".webm"):
+        return "_".join(parts[:3]), "recording"
+
+    if len(parts) == 1 and "_" in key and key.endswith((".webm", ".zip")):
+        return key.rsplit("_", 1)[0], "recording"
+
+    return None
+
+def backfill_from_s3():
+    """
+    Add every session with a recording or summary in S3 to the recording
+    session index. A summary wins over chunks for the status.
+    """
+
+    session_keys = {}
+
+    for key in list_all_files(bucket_name):
+        found = session_key_for(key)
+        if found is None:
+            continue
+
+        session_key, status = found
+        if session_keys.get(session_key) != "processed":
+            session_keys[session_key] = status
+
+    added = backfill_recording_sessions(session_keys)
+    logging.info(f"Found {len(session_keys)} recording sessions in S3, added {added} to the index")
+
+if __name__ == "__main__":
+    # python -m app.utils.backfill_recordings
+    # Run once after deploying the recording session index
+    logging.basicConfig(level=logging.INFO)
+
+    backfill_from_s3()
@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import logging
+from pymongo import ASCENDING, DESCENDING
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple, get_checkpoint_id
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+from app.utils.mongo import client
+
+# Which store chat conversations are checkpointed in: "mongo", "sqlite" or "memory"
+CHAT_CHECKPOINT_BACKEND = os.getenv("CHAT_CHECKPOINT_BACKEND", "mongo")
+
+# Shared database (not per-org) holding chat checkpoints
+CHAT_CHECKPOINT_DB_NAME = os.getenv("MONGO_CHAT_CHECKPOINT_DB", "ChatCheckpoints")
+
+# Used by the sqlite backend
+CHECKPOINT_DB = "checkpoints.db"
+
+class MongoCheckpointSaver(BaseCheckpointSaver):
+    """
+    LangGraph checkpoint saver backed by MongoDB, so chat history is shared by
+    every web worker and survives restarts.
+    """
+
+    def __init__(self, database):
+        super().__init__()
+
+        self.checkpoints = database["Checkpoints"]
+        self.writes = database["CheckpointWrites"]
+
+        self.checkpoints.create_index(
+            [("thread_id", ASCENDING), ("checkpoint_ns", ASCENDING), ("checkpoint_id", DESCENDING)],
+            unique=True
+        )
+        self.writes.create_index(
+            [("thread_id", ASCENDING), ("checkpoint_ns", ASCENDING), ("checkpoint_id", ASCENDING),
+             ("task_id", ASCENDING), ("idx", ASCENDING)],
+            unique=True
+        )
+
+    def to_tuple(self, document):
+        """
+        Turn a stored checkpoint document back into a CheckpointTuple,
+        including any pending writes saved against it.
+        """
+
+        thread_id = document["thread_id"]
+        checkpoint_ns = document["checkpoint_ns"]
+        checkpoint_id = document["checkpoint_id"]
+
+        writes = self.writes.find({
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint_id
+        }).sort([("task_id", ASCENDING), ("idx", ASCENDING)])
+
+        pending_writes = [
+            (write["task_id"], write["channel"], self.serde.loads_typed((write["type"], write["value"])))
+            for write in writes
+        ]
+
+        parent_config = None
+        if document.get("parent_checkpoint_id"):
+            parent_config = {"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": document["parent_checkpoint_id"]
+            }}
+
+        return CheckpointTuple(
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            self.serde.loads_typed((document["type"], document["checkpoint"])),
+            self.serde.loads_typed((document["metadata_type"], document["metadata"])),
+            parent_config,
+            pending_writes
+        )
+
+    def get_tuple(self, config):
+        query = {
+            "thread_id": config["configurable"]["thread_id"],
+            "checkpoint_ns": config["configurable"].get("checkpoint_ns", "")
+        }
+
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id:
+            query["checkpoint_id"] = checkpoint_id
+
+        # Checkpoint ids sort in creation order, so the highest is the latest
+        document = self.checkpoints.find_one(query, sort=[("checkpoint_id", DESCENDING)])
+
+        return self.to_tuple(document) if document else None
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = {}
+
+        if config:
+            query["thread_id"] = config["configurable"]["thread_id"]
+            query["checkpoint_ns"] = config["configurable"].get("checkpoint_ns", "")
+
+        if before:
+            query["checkpoint_id"] = {"$lt": get_checkpoint_id(before)}
+
+        documents = self.checkpoints.find(query).sort("checkpoint_id", DESCENDING)
+
+        count = 0
+        for document in documents:
+            checkpoint_tuple = self.to_tuple(document)
+
+            # Metadata is stored serialized, so filter on it here
+            if filter and any(checkpoint_tuple.metadata.get(key) != value for key, value in filter.items()):
+                continue
+
+            yield checkpoint_tuple
+
+            count += 1
+            if limit is not None and count >= limit:
+                break
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+
+        checkpoint_type, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(metadata)
+
+        self.checkpoints.update_one(
+            {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]},
+            {"$set": {
+                "parent_checkpoint_id": config["configurable"].get("checkpoint_id"),
+                "type": checkpoint_type,
+                "checkpoint": serialized_checkpoint,
+                "metadata_type": metadata_type,
+                "metadata": serialized_metadata
+            }},
+            upsert=True
+        )
+
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        for idx, (channel, value) in enumerate(writes):
+            value_type, serialized_value = self.serde.dumps_typed(value)
+
+            self.writes.update_one(
+                {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id,
+                 "task_id": task_id, "idx": idx},
+                {"$set": {"channel": channel, "type": value_type, "value": serialized_value}},
+                upsert=True
+            )
+
+def create_checkpointer(backend=CHAT_CHECKPOINT_BACKEND):
+    """
+    Create the chat checkpointer for the configured backend.
+    """
+
+    logging.info(f"Using {backend} chat checkpoint backend")
+
+    if backend == "mongo":
+        return MongoCheckpointSaver(client[CHAT_CHECKPOINT_DB_NAME])
+    elif backend == "sqlite":
+        return SqliteSaver(sqlite3.connect(CHECKPOINT_DB, check_same_thread=False))
+    elif backend == "memory":
+        return MemorySaver()
+    else:
+        raise ValueError(f"Unknown chat checkpoint backend: {backend}")
@@ -1,14 +1,14 @@
 import os
+import sys
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 from langchain_cohere import ChatCohere
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_mistralai import ChatMistralAI
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langgraph.checkpoint.sqlite import SqliteSaver
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from datetime import datetime, timedelta
@@ -16,14 +16,19 @@ from typing import Sequence
 from langchain_core.messages import BaseMessage
 from langgraph.graph.message import add_messages
 from typing_extensions import Annotated, TypedDict
-from langchain_community.chat_message_histories import SQLChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
 import pandas as pd
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import START, END, StateGraph, MessagesState
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from app.utils.mongo import get_meetings_for_chat
+from app.utils.mongo import get_meetings_for_chat, search_transcripts
+from app.utils.meeting_digest import DIGEST_PROJECTION, select_digests
+from app.utils import response_cache
+from app.utils.chat_checkpoints import create_checkpointer
 import uuid
+import logging
+import time
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Get necessary AI env vars
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -32,41 +37,128 @@ COHERE_API_KEY = os.getenv("COHERE_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 
+# How much transcript text chat may put in front of the model, and how many
+# passages at most
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", 6000))
+CHAT_CONTEXT_TOP_K = int(os.getenv("CHAT_CONTEXT_TOP_K", 12))
+
+# When reframing, answer the original and the reframed question at the same
+# time and use whichever answer is ready first
+CHAT_REFRAME_RACE = os.getenv("CHAT_REFRAME_RACE", "false").lower() == "true"
+
+# Runs reframing (and raced answers) alongside the rest of a chat request
+chat_executor = ThreadPoolExecutor(max_workers=int(os.getenv("CHAT_EXECUTOR_WORKERS", 8)))
+
+CHAT_SYSTEM_PROMPT = "Please help the user answer the question they ask about meetings using the following meeting data. Answer the question thoroughly, but in as few sentences as possible. No bullet points or lists. The meeting data is {context}"
+
+# Prompt templates are immutable, so they are built once and shared
+CHAT_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            CHAT_SYSTEM_PROMPT
+        ),
+        MessagesPlaceholder(variable_name="messages"),
+    ]
+)
+
+REFRAME_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "The user will give you a prompt. If the prompt could be reworded to more effectively get something back from a meeting transcript, rephrase it for them. Respond only with the rephrased question.",
+        ),
+        MessagesPlaceholder(variable_name="messages"),
+    ]
+)
+
+class ChatState(TypedDict):
+    messages: Annotated[Sequence[BaseMessage], add_messages]
+    context: str
+
+# Models the client can pick from. Anything else falls back to gpt-4o.
+MODEL_FACTORIES = {
+    "gpt-4o": lambda: ChatOpenAI(model="gpt-4o", openai_api_key=OPENAI_API_KEY, temperature=0),
+    "command-r-plus": lambda: ChatCohere(model="command-r-plus", cohere_api_key=COHERE_API_KEY, temperature=0),
+    "claude-3-5": lambda: ChatAnthropic(model="claude-3-5-sonnet-20241022", api_key=ANTHROPIC_API_KEY, temperature=0),
+}
+
+# Process-wide registries of model clients and compiled graphs, keyed by
+# model name. Clients keep their HTTP connection pools between requests.
+chat_models = {}
+chat_graphs = {}
+reframe_graph = None
+checkpointer = None
+registry_lock = Lock()
+
 def generate_uuid():
     return str(uuid.uuid4())
 
-def reframe_the_prompt(user_message):
-    # Define template to start all chat instances with:
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                "The user will give you a prompt. If the prompt could be reworded to more effectively get something back from a meeting transcript, rephrase it for them. Respond only with the rephrased question.",
-            ),
-            MessagesPlaceholder(variable_name="messages"),
-        ]
-    )
+def get_checkpointer():
+    """
+    Get the checkpointer shared by every chat graph in this process. The
+    backend is picked by CHAT_CHECKPOINT_BACKEND.
+    """
 
-    graph_builder = StateGraph(state_schema=MessagesState)
+    global checkpointer
+
+    with registry_lock:
+        if checkpointer is None:
+            checkpointer = create_checkpointer()
+        return checkpointer
+
+def conversation_config(user_id, conversation_id):
+    """
+    Checkpoint config for a conversation. Threads are namespaced by user so a
+    conversation id can't be used to read someone else's history.
+    """
+
+    return {"configurable": {"thread_id": f"{user_id}:{conversation_id or generate_uuid()}"}}
 
-    open_ai_model = ChatOpenAI(model="gpt-4o", openai_api_key=OPENAI_API_KEY, temperature=0)
+def conversation_history(graph, config):
+    return graph.get_state(config).values.get("messages", [])
+
+def record_turn(graph, config, question, reply, context):
+    """
+    Save a question and reply that didn't go through graph.invoke (cached or
+    streamed replies) to the conversation, as if the model node produced them.
+    """
+
+    graph.update_state(config, {"messages": [HumanMessage(question), AIMessage(reply)], "context": context}, as_node="model")
+
+def get_reframe_graph():
+    """
+    Get the compiled graph used to reframe questions, building it on first use.
+    """
+
+    global reframe_graph
+
+    if reframe_graph is not None:
+        return reframe_graph
+
+    open_ai_model = get_chat_model("gpt-4o")
 
     def call_model(state: MessagesState):
-        chain = prompt | open_ai_model
+        chain = REFRAME_PROMPT | open_ai_model
         response = chain.invoke(state)
         return {"messages": response}
-    
+
+    graph_builder = StateGraph(state_schema=MessagesState)
     graph_builder.add_node("model", call_model)
     graph_builder.add_edge(START, "model")
 
-    graph = graph_builder.compile()
+    with registry_lock:
+        if reframe_graph is None:
+            reframe_graph = graph_builder.compile()
+        return reframe_graph
 
-    config = {"configurable": {"thread_id": "2309tuaeosiegije45s"}}
+def reframe_the_prompt(user_message):
+    graph = get_reframe_graph()
 
     input_messages = [HumanMessage(user_message)]
 
-    # Run the workflow and store a checkpoint
-    output = graph.invoke({"messages": input_messages}, config)
+    # Run the workflow
+    output = graph.invoke({"messages": input_messages})
 
     # Retrieve the most recent message from the output
     user_message_reframed = output.get("messages", [])[-1] if output.get("messages") else None
@@ -75,88 +167,113 @@ def reframe_the_prompt(user_message):
 
 
 
-def generate_ai_reply(user_message, user_id, org_name, org_id, days, employee_ids, manager_ids=None, ai_model="gpt-4o", reframe_prompt=False):
+def describe_meeting(meeting):
+    """
+    Describe a meeting's type, date, attendees and length for the model.
+    Returns None if the manager or report name is missing.
+    """
 
-    # Reframe users prompt:
-    if reframe_prompt:
-        user_message_reframed = reframe_the_prompt(user_message)
-    else:
-        user_message_reframed = user_message
+    # Ensure 'date' and 'attendees' keys exist in meeting data
+    date_str = meeting.get("date", "").strftime("%m-%d-%Y") if meeting.get("date") else "Unknown Date"
 
-    # Preprocessing input
-    # ------
+    # Initialize names to avoid reference issues
+    manager_name, report_name = None, None
+    for person in meeting.get("attendees", []):
+        if person.get("role") == "Manager":
+            manager_name = f"{person.get('first_name', '')} {person.get('last_name', '')}".strip()
+        elif person.get("role") == "Report":
+            report_name = f"{person.get('first_name', '')} {person.get('last_name', '')}".strip()
 
-    # Query list of meetings for the current context
-    meetings_list = get_meetings_for_chat(
-        org_name, org_id, days, manager_ids, employee_ids, collection_name="Meetings", type_name="One-on-One"
+    # Check for valid names
+    if not (manager_name and report_name):
+        return None
+
+    attendees_section = f"between {manager_name} (manager) and {report_name} (report)"
+    meeting_duration = meeting.get("meeting_duration", "unknown duration")
+
+    return (
+        f"This was a {meeting.get('type_name', 'unknown type')} on {date_str}, "
+        f"{attendees_section}. This meeting lasted {meeting_duration}."
     )
 
-    # Enhance data quality for passing into AI model
-    context = ""
-    for count, meeting in enumerate(meetings_list):
-        # Ensure 'date' and 'attendees' keys exist in meeting data
-        date_str = meeting.get("date", "").strftime("%m-%d-%Y") if meeting.get("date") else "Unknown Date"
-        print(f"Processing Meeting #{count+1} - Date: {date_str}")
-
-        # Initialize names to avoid reference issues
-        manager_name, report_name = None, None
-        for person in meeting.get("attendees", []):
-            if person.get("role") == "Manager":
-                manager_name = f"{person.get('first_name', '')} {person.get('last_name', '')}".strip()
-            elif person.get("role") == "Report":
-                report_name = f"{person.get('first_name', '')} {person.get('last_name', '')}".strip()
-
-        # Check for valid names
-        if manager_name and report_name:
-            attendees_section = f"between {manager_name} (manager) and {report_name} (report)"
-            meeting_duration = meeting.get("meeting_duration", "unknown duration")
-            raw_text = meeting.get("raw_text", "No transcript available.")
-            meeting_details = (
-                f"Here is meeting #{count+1}. This was a {meeting.get('type_name', 'unknown type')} on {date_str}, "
-                f"{attendees_section}. This meeting lasted {meeting_duration}. Here is the transcript: {raw_text}"
-            )
-
-            context += meeting_details
+def build_retrieved_context(org_name, org_id, meetings_list, question):
+    """
+    Build the meeting context for a question from only the transcript passages
+    most relevant to it, instead of every full transcript.
+    """
+
+    meetings = {}
+    for meeting in meetings_list:
+        if describe_meeting(meeting):
+            meetings[meeting["_id"]] = meeting
         else:
-            print(f"Warning: Missing manager or report name in attendees for meeting #{count+1}.")
+            print(f"Warning: Missing manager or report name in attendees for meeting {meeting['_id']}.")
 
-    # Constructing LangGraph
-    # ------
+    if not meetings:
+        return ""
 
-    # First, define the model we will use
-    if ai_model == "gpt-4o":
-        print("USING GPT-4o")
-        model = ChatOpenAI(model="gpt-4o", openai_api_key=OPENAI_API_KEY, temperature=0)
-    elif ai_model == "command-r-plus":
-        print("USING command-r-plus")
-        model = ChatCohere(model="command-r-plus", cohere_api_key=COHERE_API_KEY, temperature=0)
-    elif ai_model == "claude-3-5":
-        model = ChatAnthropic(model="claude-3-5-sonnet-20241022", api_key=ANTHROPIC_API_KEY, temperature=0)
-    else:
-        model = ChatOpenAI(model="gpt-4o", openai_api_key=OPENAI_API_KEY, temperature=0)
-
-
-    # Define the prompt template with message objects
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                "Please help the user answer the question they ask about meetings using the following meeting data. Answer the question thoroughly, but in as few sentences as possible. No bullet points or lists. The meeting data is {context}"
-            ),
-            MessagesPlaceholder(variable_name="messages"),
-        ]
-    )
+    passages = search_transcripts(org_name, org_id, list(meetings), question, CHAT_CONTEXT_TOKEN_BUDGET, CHAT_CONTEXT_TOP_K)
+
+    # Group passages by meeting, keeping each transcript's own order
+    passages_by_meeting = {}
+    for passage in sorted(passages, key=lambda passage: passage["chunk_index"]):
+        passages_by_meeting.setdefault(passage["meeting_id"], []).append(passage["text"])
+
+    print(f"Retrieved {len(passages)} passages from {len(passages_by_meeting)} of {len(meetings)} meetings")
+
+    context = ""
+    ordered = sorted(passages_by_meeting, key=lambda meeting_id: meetings[meeting_id].get("date") or datetime.min)
+    for count, meeting_id in enumerate(ordered):
+        excerpts = " ... ".join(passages_by_meeting[meeting_id])
+        context += (
+            f"Here is meeting #{count+1}. {describe_meeting(meetings[meeting_id])} "
+            f"Here are the relevant parts of the transcript: {excerpts} "
+        )
+
+    return context
+
+def build_digest_context(meetings_list):
+    """
+    Build the meeting context from each meeting's precomputed digest, newest
+    meetings first when they don't all fit the token budget.
+    """
+
+    meetings = [meeting for meeting in meetings_list if describe_meeting(meeting)]
+
+    context = ""
+    for count, (meeting, digest) in enumerate(select_digests(meetings, CHAT_CONTEXT_TOKEN_BUDGET)):
+        context += f"Here is meeting #{count+1}. {describe_meeting(meeting)} Here is a digest of the meeting: {digest['text']} "
+
+    return context
+
+def model_key(ai_model):
+    return ai_model if ai_model in MODEL_FACTORIES else "gpt-4o"
 
-    class State(TypedDict):
-        messages: Annotated[Sequence[BaseMessage], add_messages]
-        context: str
+def get_chat_model(ai_model):
+    """
+    Get the shared chat model client for the model name the client selected,
+    defaulting to gpt-4o.
+    """
+
+    key = model_key(ai_model)
+
+    with registry_lock:
+        if key not in chat_models:
+            print(f"USING {key}")
+            chat_models[key] = MODEL_FACTORIES[key]()
+        return chat_models[key]
+
+def build_chat_graph(model, checkpointer):
+    """
+    Build and compile the chat graph around a model.
+    """
 
     # Define a new graph
-    graph_builder = StateGraph(state_schema=State)
+    graph_builder = StateGraph(state_schema=ChatState)
 
     # Define the function that calls the model
-    def call_model(state: State):
-        chain = prompt | model
+    def call_model(state: ChatState):
+        chain = CHAT_PROMPT | model
         response = chain.invoke(state)
         return {"messages": response}
     
@@ -169,43 +286,263 @@ def generate_ai_reply(user_message, user_id, org_name, org_id, days, employee_id
     # Set the ending place so the graph knows where to exit
     graph_builder.add_edge("model", END)
 
-    # Use a SQLite database file for persistent checkpointing
-    DB_URI = "checkpoints.db"
+    return graph_builder.compile(checkpointer=checkpointer)
 
-    # Use SqliteSaver within a context manager for storing, loading, and listing checkpoints
-    with SqliteSaver.from_conn_string(DB_URI) as sqlite_saver:
-        # Create ID for this conversation
-        unique_id = generate_uuid()
+def get_chat_graph(ai_model):
+    """
+    Get the compiled chat graph for a model, building it on first use.
+    """
 
-        graph = graph_builder.compile(checkpointer=sqlite_saver)
+    key = model_key(ai_model)
 
-        # Configuration for checkpointing
-        config = {"configurable": {"thread_id": unique_id}}
+    if key in chat_graphs:
+        return chat_graphs[key]
 
-        # Define input message
-        input_messages = [HumanMessage(user_message_reframed)]
-        
-        # Run the workflow and store a checkpoint
-        output = graph.invoke({"messages": input_messages, "context": context}, config)
-        
-        # Retrieve the most recent message from the output
-        most_recent = output.get("messages", [])[-1] if output.get("messages") else None
+    graph = build_chat_graph(get_chat_model(key), get_checkpointer())
 
-        if most_recent:
-            content = most_recent.content
+    with registry_lock:
+        return chat_graphs.setdefault(key, graph)
 
-        else:
-            return "No response was generated. Please try again."
+def measure_setup_overhead(ai_model="gpt-4o", iterations=20):
+    """
+    Compare the per-request cost of building a model client and compiling the
+    chat graph from scratch against fetching them from the registry. No model
+    calls are made. Returns average milliseconds for each.
+    """
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        build_chat_graph(MODEL_FACTORIES[model_key(ai_model)](), None)
+    uncached = (time.perf_counter() - start) / iterations * 1000
+
+    get_chat_graph(ai_model)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        get_chat_graph(ai_model)
+    cached = (time.perf_counter() - start) / iterations * 1000
+
+    return {"uncached_ms": round(uncached, 3), "cached_ms": round(cached, 3)}
+
+def load_chat_meetings(org_name, org_id, days, employee_ids, manager_ids, user_message, ai_model, reframe_prompt, use_transcripts):
+    """
+    Get the meetings in scope for a chat question, without transcripts, and
+    the response cache key for the question about them.
+    """
+
+    # Query list of meetings for the current context, without transcripts
+    meetings_list = get_meetings_for_chat(
+        org_name, org_id, days, manager_ids, employee_ids, collection_name="Meetings", type_name="One-on-One",
+        projection=DIGEST_PROJECTION
+    )
+
+    # The same question about the same unchanged meetings gets the same answer
+    cache_key = response_cache.make_key(ai_model, CHAT_SYSTEM_PROMPT, user_message, meetings_list,
+                                        reframe_prompt=bool(reframe_prompt), use_transcripts=bool(use_transcripts))
+
+    return meetings_list, cache_key
 
-        # if reframe_prompt:
+def start_reframe(user_message, reframe_prompt):
+    """
+    Start reframing the question in the background, so it overlaps with
+    fetching and formatting the meeting context. Returns a future, or None
+    when not reframing.
+    """
 
-        #     content = f'Recreated Prompt: "{user_message_reframed}" ' + content
+    if not reframe_prompt:
+        return None
 
-        # Example of loading the checkpoint
-        saved_checkpoint = sqlite_saver.get(config)
+    return chat_executor.submit(reframe_the_prompt, user_message)
 
-        # Example of listing checkpoints
-        checkpoints = list(sqlite_saver.list(config))
+def reframed_question(user_message, reframe_future):
+    """
+    Wait for a reframed question, falling back to the original if reframing
+    wasn't requested or failed.
+    """
+
+    if reframe_future is None:
+        return user_message
+
+    try:
+        return reframe_future.result()
+    except Exception as e:
+        logging.error(f"Failed to reframe prompt, using the original: {e}")
+        return user_message
+
+def build_chat_context(org_name, org_id, meetings_list, user_message, reframe_future, use_transcripts):
+    """
+    Build the meeting context and wait for the reframed question. Digest
+    context doesn't depend on the question, so it is built while reframing is
+    still running. Returns (question, context).
+    """
+
+    # Enhance data quality for passing into AI model
+    if use_transcripts:
+        user_message_reframed = reframed_question(user_message, reframe_future)
+        context = build_retrieved_context(org_name, org_id, meetings_list, user_message_reframed)
+    else:
+        context = build_digest_context(meetings_list)
+        user_message_reframed = reframed_question(user_message, reframe_future)
+
+    return user_message_reframed, context
+
+def race_reframed_answer(ai_model, history, user_message, reframe_future, context):
+    """
+    Answer the original question straight away and the reframed question once
+    reframing finishes, returning whichever answer is ready first as
+    (question, reply).
+    """
+
+    chain = CHAT_PROMPT | get_chat_model(ai_model) | StrOutputParser()
+
+    def answer(question):
+        return question, chain.invoke({"messages": history + [HumanMessage(question)], "context": context})
+
+    original = chat_executor.submit(answer, user_message)
+    reframed = chat_executor.submit(lambda: answer(reframe_future.result()))
+
+    done, pending = wait([original, reframed], return_when=FIRST_COMPLETED)
+    winner = done.pop()
+
+    # If the first to finish failed, fall back to the other one
+    if winner.exception() is not None:
+        logging.error(f"Raced chat answer failed: {winner.exception()}")
+        winner = reframed if winner is original else original
+
+    print(f"Race won by the {'original' if winner is original else 'reframed'} question")
+    return winner.result()
+
+def stream_ai_reply(user_message, user_id, org_name, org_id, days, employee_ids, manager_ids=None, ai_model="gpt-4o",
+                    reframe_prompt=False, use_transcripts=False, conversation_id=None, is_cancelled=lambda: False):
+    """
+    Same as generate_ai_reply, but yields the reply in pieces as the model
+    produces them. Stops early, closing the model stream, once is_cancelled()
+    returns True. Cancelled turns aren't saved to the conversation.
+    """
+
+    # Reframe while the meetings are fetched
+    reframe_future = start_reframe(user_message, reframe_prompt)
+
+    graph = get_chat_graph(ai_model)
+    config = conversation_config(user_id, conversation_id)
+    history = conversation_history(graph, config)
+
+    meetings_list, cache_key = load_chat_meetings(org_name, org_id, days, employee_ids, manager_ids,
+                                                  user_message, ai_model, reframe_prompt, use_transcripts)
+
+    # Follow-up questions depend on the conversation, so only first turns are cached
+    cached_reply = None if history else response_cache.get_reply(cache_key)
+    if cached_reply is not None:
+        if reframe_future:
+            reframe_future.cancel()
+        record_turn(graph, config, user_message, cached_reply, "")
+        yield cached_reply
+        return
+
+    user_message_reframed, context = build_chat_context(org_name, org_id, meetings_list, user_message,
+                                                        reframe_future, use_transcripts)
+
+    if is_cancelled():
+        return
+
+    chain = CHAT_PROMPT | get_chat_model(ai_model) | StrOutputParser()
+
+    pieces = []
+    for piece in chain.stream({"messages": history + [HumanMessage(user_message_reframed)], "context": context}):
+        if is_cancelled():
+            logging.info("Chat stream cancelled by the client")
+            return
+
+        pieces.append(piece)
+        yield piece
+
+    reply = "".join(pieces)
+    record_turn(graph, config, user_message_reframed, reply, context)
+
+    if not history:
+        response_cache.store_reply(cache_key, meetings_list, reply)
+
+def generate_ai_reply(user_message, user_id, org_name, org_id, days, employee_ids, manager_ids=None, ai_model="gpt-4o", reframe_prompt=False, use_transcripts=False, conversation_id=None):
+    """
+    Answer a question about the selected meetings. Meetings are described by
+    their digests, unless use_transcripts is set, in which case the transcript
+    passages most relevant to the question are used instead.
+
+    Turns sharing a conversation_id are one conversation: earlier questions and
+    replies are loaded from the checkpoint store, so only the new question
+    needs to be sent.
+    """
+
+    # Reframe users prompt while the rest of the request is set up
+    reframe_future = start_reframe(user_message, reframe_prompt)
+
+    # Constructing LangGraph
+    # ------
+
+    # The model client and compiled graph are shared across requests
+    setup_start = time.perf_counter()
+    graph = get_chat_graph(ai_model)
+    logging.info(f"Chat graph setup took {(time.perf_counter() - setup_start) * 1000:.2f} ms")
+
+    # Configuration for checkpointing
+    config = conversation_config(user_id, conversation_id)
+    history = conversation_history(graph, config)
+
+    # Preprocessing input
+    # ------
+
+    meetings_list, cache_key = load_chat_meetings(org_name, org_id, days, employee_ids, manager_ids,
+                                                  user_message, ai_model, reframe_prompt, use_transcripts)
+
+    # Follow-up questions depend on the conversation, so only first turns are cached
+    cached_reply = None if history else response_cache.get_reply(cache_key)
+    if cached_reply is not None:
+        if reframe_future:
+            reframe_future.cancel()
+        record_turn(graph, config, user_message, cached_reply, "")
+        return cached_reply
+
+    if reframe_future and CHAT_REFRAME_RACE:
+        # Context is built for the original question so both answers can
+        # start without waiting on the reframe
+        _, context = build_chat_context(org_name, org_id, meetings_list, user_message, None, use_transcripts)
+        user_message_reframed, content = race_reframed_answer(ai_model, history, user_message, reframe_future, context)
+        record_turn(graph, config, user_message_reframed, content, context)
+
+        if not history:
+            response_cache.store_reply(cache_key, meetings_list, content)
+
+        return content
+
+    user_message_reframed, context = build_chat_context(org_name, org_id, meetings_list, user_message,
+                                                        reframe_future, use_transcripts)
+
+    # Define input message
+    input_messages = [HumanMessage(user_message_reframed)]
+    
+    # Run the workflow and store a checkpoint. Earlier turns are loaded from
+    # the checkpoint store.
+    output = graph.invoke({"messages": input_messages, "context": context}, config)
+    
+    # Retrieve the most recent message from the output
+    most_recent = output.get("messages", [])[-1] if output.get("messages") else None
+
+    if most_recent:
+        content = most_recent.content
+
+    else:
+        return "No response was generated. Please try again."
+
+    # if reframe_prompt:
+
+    #     content = f'Recreated Prompt: "{user_message_reframed}" ' + content
+
+    if not history:
+        response_cache.store_reply(cache_key, meetings_list, content)
 
     # Return the content of the most recent message if available
     return content
+
+if __name__ == "__main__":
+    # python -m app.utils.llm_interactions [ai_model]
+    ai_model = sys.argv[1] if len(sys.argv) > 1 else "gpt-4o"
+    print(f"Chat setup overhead for {ai_model}: {measure_setup_overhead(ai_model)}")
@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import tempfile
+import subprocess
+
+def run_ffprobe(arguments, source):
+    """
+    Run ffprobe on a file path or on in-memory bytes (fed through stdin).
+    Returns its stdout as text.
+    """
+
+    if isinstance(source, (bytes, bytearray)):
+        command, data = ["ffprobe", "-v", "error", *arguments, "pipe:0"], bytes(source)
+    else:
+        command, data = ["ffprobe", "-v", "error", *arguments, source], None
+
+    result = subprocess.run(command, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+    return result.stdout.decode()
+
+def probe_duration(source):
+    """
+    Duration of a media file in seconds, read from the container metadata
+    without decoding any audio. Streams without a duration in their header,
+    like MediaRecorder's webm chunks, fall back to the end time of the last
+    audio packet, which only needs the file demuxed. Raises ValueError when
+    no duration can be found.
+    """
+
+    duration = run_ffprobe(["-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1"], source).strip()
+
+    if duration and duration != "N/A":
+        return float(duration)
+
+    packets = run_ffprobe(["-select_streams", "a", "-show_entries", "packet=pts_time,duration_time", "-of", "csv=p=0"], source)
+
+    end = None
+    for line in packets.splitlines():
+        try:
+            pts_time, duration_time = (float(value) for value in line.split(",")[:2])
+        except ValueError:
+            continue
+        end = max(end or 0, pts_time + duration_time)
+
+    if end is None:
+        raise ValueError("Could not find a duration for the media.")
+
+    return end
+
+def format_duration(seconds):
+    seconds = int(seconds)
+
+    return f"{seconds // 3600}h {(seconds % 3600) // 60}m {seconds % 60}s"
+
+def read_with_moviepy(path):
+    from moviepy.editor import VideoFileClip
+
+    clip = VideoFileClip(path)
+    duration = clip.duration
+    clip.close()
+    return duration
+
+def read_with_pydub(path):
+    from pydub import AudioSegment
+
+    return len(AudioSegment.from_file(path)) / 1000
+
+# Ways of reading a duration that benchmark compares, and "none" to show what
+# an interpreter that only imports this module costs
+METHODS = {
+    "none": lambda path: None,
+    "ffprobe": probe_duration,
+    "moviepy": read_with_moviepy,
+    "pydub": read_with_pydub
+}
+
+def measure(name, path):
+    """
+    Read a duration with one method and print the time it took and the peak
+    RSS, the larger of this process's and that of the ffmpeg processes it
+    waited on, as JSON.
+    Meant to run in a fresh interpreter, so nothing else has raised the peak.
+    """
+
+    start = time.perf_counter()
+    duration = METHODS[name](path)
+    elapsed = time.perf_counter() - start
+
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    print(json.dumps({"duration": duration, "elapsed": elapsed, "peak_rss": peak_rss}))
+
+def benchmark(path):
+    """
+    Compare probing a file's duration with the full decodes it replaces:
+    moviepy's VideoFileClip and pydub's AudioSegment. Each method runs in its
+    own interpreter, so its peak memory is not hidden by an earlier one's.
+    """
+
+    for name in METHODS:
+        result = subprocess.run([sys.executable, "-m", "app.utils.media_probe", "--measure", name, path],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        if result.returncode != 0:
+            errors = result.stderr.decode().strip().splitlines()
+            print(f"{name}: failed: {errors[-1] if errors else result.returncode}")
+            continue
+
+        measured = json.loads(result.stdout.decode().strip().splitlines()[-1])
+
+        # ru_maxrss is in kilobytes on Linux
+        print(f"{name}: duration={measured['duration']} in {measured['elapsed'] * 1000:.0f}ms, peak RSS {measured['peak_rss'] / 1024:.0f}MB")
+
+if __name__ == "__main__":
+    # python -m app.utils.media_probe [file]
+    # Without a file, a 2-hour sample video is generated to benchmark with
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) > 3 and sys.argv[1] == "--measure":
+        measure(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) > 1:
+        benchmark(sys.argv[1])
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            sample = os.path.join(folder, "sample.mp4")
+            subprocess.run([
+                "ffmpeg", "-nostdin", "-loglevel", "error",
+                "-f", "lavfi", "-i", "color=size=320x240:rate=1:duration=7200",
+                "-f", "lavfi", "-i", "sine=frequency=440:duration=7200",
+                "-c:v", "libx264", "-c:a", "aac", "-shortest", sample
+            ], check=True)
+            print(f"Generated a 2-hour sample of {os.path.getsize(sample) / 1024 / 1024:.0f}MB")
+            benchmark(sample)
@@ -0,0 +1,67 @@
+import os
+from datetime import datetime
+from app.utils.transcript_index import count_tokens
+
+# Rough size of the condensed transcript kept in each meeting's digest
+DIGEST_TARGET_TOKENS = int(os.getenv("DIGEST_TARGET_TOKENS", 400))
+
+# Fields chat needs to build digest context, without the raw transcript
+DIGEST_PROJECTION = {
+    "type_name": 1,
+    "meeting_duration": 1,
+    "attendees": {"first_name": 1, "last_name": 1, "role": 1},
+    "date": 1,
+    "summary": 1,
+    "digest": 1,
+    "version": 1
+}
+
+def render_summary(summary):
+    """
+    Flatten a structured meeting summary into "Category: text" lines.
+    """
+
+    return "\n".join(f"{category}: {text}" for category, text in (summary or {}).items() if text)
+
+def build_digest(summary, condensed_transcript):
+    """
+    Build the digest stored on a meeting: the structured summary plus a
+    condensed transcript, rendered once and token counted.
+    """
+
+    text = render_summary(summary)
+    if condensed_transcript:
+        text += f"\nCondensed transcript: {condensed_transcript}"
+
+    return {
+        "text": text,
+        "tokens": count_tokens(text),
+        "condensed_transcript": condensed_transcript,
+        "created_at": datetime.now()
+    }
+
+def meeting_digest(meeting):
+    """
+    Get a meeting's digest, building a summary-only one for meetings saved
+    before digests existed.
+    """
+
+    return meeting.get("digest") or build_digest(meeting.get("summary"), None)
+
+def select_digests(meetings, token_budget):
+    """
+    Pick the most recent meetings whose digests fit in token_budget. Returns
+    (meeting, digest) pairs in chronological order.
+    """
+
+    selected, used = [], 0
+
+    for meeting in sorted(meetings, key=lambda meeting: meeting.get("date") or datetime.min, reverse=True):
+        digest = meeting_digest(meeting)
+        if used + digest["tokens"] > token_budget:
+            continue
+        selected.append((meeting, digest))
+        used += digest["tokens"]
+
+    selected.reverse()
+    return selected
@@ -1,11 +1,18 @@
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
+from pymongo import ReturnDocument
 import os
 from datetime import datetime, timedelta
 from pytz import timezone
 from dotenv import load_dotenv
 from bson import ObjectId
+from bson.errors import InvalidId
+import base64
 import logging
+from app.utils import transcript_index
+from app.utils import response_cache
+from app.utils import meeting_digest
+from app.utils import prompt_cache
 
 load_dotenv()
 
@@ -14,11 +21,204 @@ uri = os.getenv("MONGO_URI")
 # Create a new client and connect to the server
 client = MongoClient(uri, server_api=ServerApi(version="1", strict=True, deprecation_errors=True))
 
+# Shared database (not per-org) holding the recording session index
+RECORDINGS_DB_NAME = os.getenv("MONGO_RECORDINGS_DB", "Recordings")
+
+_recording_index_ready = False
+_pipeline_index_ready = False
+
+def build_session_key(username, report, date):
+    """
+    Build the key identifying a recording session. This matches the prefix of
+    the audio chunk keys uploaded to S3 ("username_report_date_N.webm").
+    """
+
+    return f"{username}_{report}_{date}"
+
+def get_recording_sessions_collection(collection_name="RecordingSessions"):
+    """
+    Get the recording session collection, creating its unique index on
+    session_key the first time it is used in this process.
+    """
+
+    global _recording_index_ready
+
+    collection = client[RECORDINGS_DB_NAME][collection_name]
+
+    if not _recording_index_ready:
+        collection.create_index("session_key", unique=True)
+        _recording_index_ready = True
+
+    return collection
+
+def mark_recording_started(session_key):
+    """
+    Record that audio has started arriving for a session. Safe to call more
+    than once, only the first call inserts the document.
+    """
+
+    collection = get_recording_sessions_collection()
+
+    collection.update_one(
+        {"session_key": session_key},
+        {"$setOnInsert": {
+            "status": "recording",
+            "started_at": datetime.utcnow()
+        }},
+        upsert=True
+    )
+
+def mark_recording_processed(session_key):
+    """
+    Record that a session's audio has been transcribed and summarized.
+    """
+
+    collection = get_recording_sessions_collection()
+
+    collection.update_one(
+        {"session_key": session_key},
+        {"$set": {"status": "processed", "processed_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+def backfill_recording_sessions(session_keys):
+    """
+    Add sessions recorded before the index existed, so the duplicate check
+    still finds them. session_keys maps each session key to its status.
+    Sessions already in the index are left alone. Returns how many were
+    added.
+    """
+
+    collection = get_recording_sessions_collection()
+    added = 0
+
+    for session_key, status in session_keys.items():
+        result = collection.update_one(
+            {"session_key": session_key},
+            {"$setOnInsert": {"status": status, "backfilled_at": datetime.utcnow()}},
+            upsert=True
+        )
+        if result.upserted_id is not None:
+            added += 1
+
+    return added
+
+def recording_session_exists(session_key):
+    """
+    Check whether a session has already been recorded or processed. This is a
+    single lookup on the unique session_key index.
+    """
+
+    collection = get_recording_sessions_collection()
+
+    return collection.find_one({"session_key": session_key}, {"_id": 1}) is not None
+
+def get_pipeline_runs_collection(collection_name="PipelineRuns"):
+    """
+    Get the collection tracking meeting-processing pipeline runs, creating its
+    status index the first time it is used in this process.
+    """
+
+    global _pipeline_index_ready
+
+    collection = client[RECORDINGS_DB_NAME][collection_name]
+
+    if not _pipeline_index_ready:
+        collection.create_index("status")
+        _pipeline_index_ready = True
+
+    return collection
+
+def get_pipeline_run(run_id):
+    return get_pipeline_runs_collection().find_one({"_id": run_id})
+
+def open_pipeline_run(run_id, kind, params):
+    """
+    Create a pipeline run, or reopen an existing one, and mark it running.
+    Stages completed by earlier attempts are kept so the run resumes after
+    them. Returns the run document.
+    """
+
+    collection = get_pipeline_runs_collection()
+    now = datetime.utcnow()
+
+    return collection.find_one_and_update(
+        {"_id": run_id},
+        {
+            "$setOnInsert": {"kind": kind, "params": params, "stages": {}, "progress": {}, "created_at": now},
+            "$set": {"status": "running", "updated_at": now},
+            "$unset": {"failed_stage": "", "error": ""}
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+def complete_pipeline_stage(run_id, stage, output):
+    """
+    Persist a stage's output. Later stages read their inputs from here.
+    """
+
+    now = datetime.utcnow()
+
+    get_pipeline_runs_collection().update_one(
+        {"_id": run_id},
+        {"$set": {f"stages.{stage}": {"output": output, "completed_at": now}, "updated_at": now}}
+    )
+
+def record_pipeline_progress(run_id, stage, item):
+    """
+    Record a finished unit of work inside a stage (e.g. one email sent), so a
+    retried stage does not repeat it.
+    """
+
+    get_pipeline_runs_collection().update_one(
+        {"_id": run_id},
+        {"$addToSet": {f"progress.{stage}": item}, "$set": {"updated_at": datetime.utcnow()}}
+    )
+
+def fail_pipeline_run(run_id, stage, error):
+    get_pipeline_runs_collection().update_one(
+        {"_id": run_id},
+        {"$set": {"status": "failed", "failed_stage": stage, "error": error, "updated_at": datetime.utcnow()}}
+    )
+
+def finish_pipeline_run(run_id):
+    now = datetime.utcnow()
+
+    get_pipeline_runs_collection().update_one(
+        {"_id": run_id},
+        {"$set": {"status": "done", "finished_at": now, "updated_at": now}}
+    )
+
+def get_failed_pipeline_runs():
+    return list(get_pipeline_runs_collection().find({"status": "failed"}, {"_id": 1, "failed_stage": 1, "error": 1}))
+
+def get_prompt_generation(org_name, org_id, collection_name="PromptGenerations"):
+    """
+    Get the org's prompt generation, a counter bumped whenever its meeting
+    types change. It keys the prompt cache, so every process sees changes.
+    """
+
+    document = client[org_name][collection_name].find_one({"_id": org_id})
+
+    return document["generation"] if document else 0
+
+def bump_prompt_generation(org_name, org_id, collection_name="PromptGenerations"):
+    client[org_name][collection_name].update_one({"_id": org_id}, {"$inc": {"generation": 1}}, upsert=True)
+    prompt_cache.invalidate_org(org_name, org_id)
+
 def get_prompts(org_name, org_id, type_name, user_id, collection_name="MeetingTypes"):
     """
     Get all meeting-types and prompts (company-wide) and user added meeting-types 
-    and prompts if there are any.
+    and prompts if there are any. Resolved prompts are cached until the org's
+    meeting types change.
     """
+
+    cache_key = (org_name, org_id, "prompts", type_name, str(user_id), get_prompt_generation(org_name, org_id))
+    cached = prompt_cache.get(cache_key)
+    if cached:
+        system_prompt, categories = cached
+        return system_prompt, list(categories)
     
     print(f"Getting prompts for {org_name} with org_id {org_id} and type_name {type_name} and user_id {user_id}")
 
@@ -59,13 +259,17 @@ def get_prompts(org_name, org_id, type_name, user_id, collection_name="MeetingTy
             system_prompt += f"{category}: {description}\n"
             categories.append(category)  # Store the category
 
+    prompt_cache.store(cache_key, (system_prompt, tuple(categories)))
+
     return system_prompt, categories
 
-def add_meeting(org_name, org_id, raw_text, json_summary, attendees, meeting_duration, type_name, meeting_name, collection_name="Meeting"):
+def add_meeting(org_name, org_id, raw_text, json_summary, attendees, meeting_duration, type_name, meeting_name, collection_name="Meeting", digest=None, pipeline_run_id=None):
     """
     Add a meeting that has occured to Mongo database. This includes the raw text,
     summary in json format, attendees of the meeting, the duration of the meeting, 
-    the type of meeting, and the name of the meeting.
+    the type of meeting, the name of the meeting, and the digest used by chat.
+    Meetings from a pipeline run are upserted on the run id, so a retried run
+    never adds the meeting twice.
     """
 
     logging.info(f"Adding meeting to {org_name} with org_id {org_id} and type_name {type_name}")
@@ -77,29 +281,162 @@ def add_meeting(org_name, org_id, raw_text, json_summary, attendees, meeting_dur
     pacific = timezone("US/Mountain")
     local_datetime = pacific.localize(utc_datetime)
 
-    collection.insert_one({
+    try:
+        meeting_duration_seconds = duration_to_seconds(meeting_duration)
+    except Exception:
+        meeting_duration_seconds = None
+
+    meeting = {
         "type_name": type_name,
         "meeting_name": meeting_name,
         "org_id": org_id,
         "meeting_duration": meeting_duration,
+        "meeting_duration_seconds": meeting_duration_seconds,
         "attendees": attendees,
         "date": local_datetime,
         "raw_text": raw_text,
-        "summary": json_summary
-        })
+        "summary": json_summary,
+        "digest": digest
+        }
+
+    if pipeline_run_id is None:
+        collection.insert_one(meeting)
+    else:
+        meeting["pipeline_run_id"] = pipeline_run_id
+        collection.update_one({"pipeline_run_id": pipeline_run_id}, {"$setOnInsert": meeting}, upsert=True)
+        meeting = collection.find_one({"pipeline_run_id": pipeline_run_id}, {"org_id": 1, "date": 1, "type_name": 1, "raw_text": 1})
 
-def get_oneonone_meetings(meeting_type, org_name, org_id, attendee_info, collection_name="Meetings"):
+    # Build the transcript chunk index used for chat retrieval. Chat indexes
+    # any meeting missing from it, so a failure here isn't fatal.
+    try:
+        transcript_index.index_meeting(database, meeting, collection_name)
+    except Exception as e:
+        logging.error(f"Failed to index transcript for meeting {meeting['_id']}: {e}")
+
+def get_pipeline_meeting(org_name, pipeline_run_id, collection_name="Meetings"):
     """
-    Get all one-on-one meetings between a specific manager and specific employee.
+    Get the meeting a pipeline run already saved, if any.
+    """
+
+    return client[org_name][collection_name].find_one({"pipeline_run_id": pipeline_run_id}, {"summary": 1})
+
+# Fields rendered by meeting list views. Leaves out raw_text and the rest of
+# the summary so list pages only transfer a few hundred bytes per meeting.
+MEETING_CARD_PROJECTION = {
+    "date": 1,
+    "meeting_duration": 1,
+    "type_name": 1,
+    "meeting_name": 1,
+    "attendees": 1,
+    "summary.Meeting Summary": 1,
+    "summary.Meeting summary": 1
+}
+
+# Meeting history pages are ordered newest first, with _id breaking ties
+# between meetings on the same date so the order is stable
+PAGE_SORT = [("date", -1), ("_id", -1)]
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(meeting):
+    """
+    Build an opaque "after" cursor pointing at the given meeting.
+    """
+
+    value = f"{meeting['date'].isoformat()}|{meeting['_id']}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+def decode_cursor(cursor):
+    """
+    Turn an "after" cursor back into (date, ObjectId). Raises ValueError if
+    the cursor is malformed.
+    """
+
+    try:
+        date, meeting_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(date), ObjectId(meeting_id)
+    except (ValueError, TypeError, InvalidId) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def parse_page_args(args):
+    """
+    Read the limit/after pagination parameters from request args. Returns
+    (limit, after). Without either parameter the limit is None, so existing
+    clients still get every meeting, but that is deprecated and logged; an
+    after cursor on its own gets pages of DEFAULT_PAGE_SIZE. Raises
+    ValueError for a bad limit or cursor.
+    """
+
+    after = args.get("after") or None
+    if after:
+        decode_cursor(after)
+
+    if "limit" not in args:
+        if not after:
+            logging.warning("Meeting list requested without a limit. Unpaginated meeting lists are deprecated, pass limit.")
+        return (DEFAULT_PAGE_SIZE if after else None), after
+
+    limit = int(args["limit"])
+    if limit < 1:
+        raise ValueError("limit must be positive")
+
+    return min(limit, MAX_PAGE_SIZE), after
+
+def page_query(query, after):
+    """
+    Restrict a query to meetings that sort after the given cursor.
+    """
+
+    if not after:
+        return query
+
+    date, meeting_id = decode_cursor(after)
+
+    return {"$and": [query, {"$or": [
+        {"date": {"$lt": date}},
+        {"date": date, "_id": {"$lt": meeting_id}}
+    ]}]}
+
+def find_page(collection, query, projection=None, limit=None, after=None):
+    """
+    Run a meeting query, optionally as a keyset page. When a limit is given,
+    results are sorted by PAGE_SORT and one extra meeting is fetched so
+    split_page can tell whether there is a next page.
+    """
+
+    if limit is None and not after:
+        return collection.find(query, projection)
+
+    results = collection.find(page_query(query, after), projection).sort(PAGE_SORT)
+
+    if limit is not None:
+        results = results.limit(limit + 1)
+
+    return results
+
+def split_page(meetings, limit):
+    """
+    Split results from find_page into (page, next_cursor). next_cursor is
+    None on the last page.
+    """
+
+    meetings = list(meetings)
+
+    if limit is None or len(meetings) <= limit:
+        return meetings, None
+
+    page = meetings[:limit]
+    return page, encode_cursor(page[-1])
+
+def oneonone_meetings_query(meeting_type, org_id, attendee_info):
+    """
+    Query for meetings between a specific manager and specific employee.
     """
 
     manager_id = attendee_info["manager_id"]
     report_id = attendee_info["report_id"]
 
-    database = client[org_name]
-    collection = database[collection_name]
-
-    results = collection.find({
+    return {
         "type_name": meeting_type,
         "org_id": org_id,
         "attendees": {
@@ -108,14 +445,27 @@ def get_oneonone_meetings(meeting_type, org_name, org_id, attendee_info, collect
                 {"$elemMatch": {"user_id": report_id}}
             ]
         }
-        })
+        }
+
+def get_oneonone_meetings(meeting_type, org_name, org_id, attendee_info, projection=None, limit=None, after=None, collection_name="Meetings"):
+    """
+    Get all one-on-one meetings between a specific manager and specific employee.
+    Pass a projection (e.g. MEETING_CARD_PROJECTION) to limit the fields returned,
+    and limit/after to fetch a single page.
+    """
+
+    database = client[org_name]
+    collection = database[collection_name]
+
+    results = find_page(collection, oneonone_meetings_query(meeting_type, org_id, attendee_info), projection, limit, after)
 
     return results
 
-def get_all_employee_meetings(org_name, org_id, days, attendee_info, collection_name="Meetings"):
+def get_all_employee_meetings(org_name, org_id, days, attendee_info, projection=None, limit=None, after=None, collection_name="Meetings"):
     """
     Get all one-on-one meetings with a specific employee as a direct report
-    within the last 'days' days, returning only specific fields.
+    within the last 'days' days, returning only specific fields. Pass a
+    projection to override the default fields, which include raw_text.
     """
 
     employee_id = attendee_info["employee_id"]
@@ -128,7 +478,8 @@ def get_all_employee_meetings(org_name, org_id, days, attendee_info, collection_
     collection = database[collection_name]
     
     # Query with both the attendee and date filter, using a projection
-    results = collection.find(
+    results = find_page(
+        collection,
         {
             "org_id": org_id,
             "attendees": {
@@ -141,14 +492,16 @@ def get_all_employee_meetings(org_name, org_id, days, attendee_info, collection_
                 "$gte": cutoff_date
             }
         },
-        {
+        projection or {
             "type_name": 1,
             "meeting_duration": 1,
             "attendees": 1,
             "date": 1,
             "raw_text": 1,
             "summary": 1
-        }
+        },
+        limit,
+        after
     )
 
     return list(results)
@@ -194,10 +547,11 @@ def get_employee_meetings_for_chat(org_name, org_id, days, attendee_info, collec
 
     return list(results)
 
-def get_all_manager_meetings(org_name, org_id, days, attendee_info, collection_name="Meetings"):
+def get_all_manager_meetings(org_name, org_id, days, attendee_info, projection=None, limit=None, after=None, collection_name="Meetings"):
     """
     Get all meetings held by a specific manager, regardless of type, within the last 'days' days,
-    returning only specific fields.
+    returning only specific fields. Pass a projection to override the default
+    fields, which include raw_text.
     """
     print(f"Getting manager meetings for org {org_name}, org id {org_id}, from now to {days} ago, with attendees {attendee_info}")
 
@@ -212,7 +566,8 @@ def get_all_manager_meetings(org_name, org_id, days, attendee_info, collection_n
     collection = database[collection_name]
     
     # Query with both the attendee and date filter, using a projection
-    results = collection.find(
+    results = find_page(
+        collection,
         {
             "org_id": org_id,
             "attendees": {
@@ -225,32 +580,29 @@ def get_all_manager_meetings(org_name, org_id, days, attendee_info, collection_n
                 "$gte": cutoff_date
             }
         },
-        {
+        projection or {
             "type_name": 1,
             "meeting_duration": 1,
             "summary": 1,
             "attendees": 1,
             "date": 1,
             "raw_text": 1
-        }
+        },
+        limit,
+        after
     )
 
     return list(results)
 
-def get_meetings_for_chat(org_name, org_id, days, manager_id_list, report_id_list, collection_name="Meetings", type_name="One-on-One"):
+def meetings_for_chat_query(org_id, days, manager_id_list, report_id_list):
     """
-    Get all meetings held by a specific manager, regardless of type, within the last 'days' days,
-    returning only specific fields.
+    Query for one-on-one meetings within the last 'days' days involving any of
+    the given managers and reports.
     """
 
     # Calculate the cutoff date
     cutoff_date = datetime.now() - timedelta(days=days)
 
-    # Connect to the database and collection
-    database = client[org_name]
-    collection = database[collection_name]
-    
-   
     # Base query for filtering by organization, meeting type, and date range
     query = {
         "org_id": org_id,
@@ -279,10 +631,23 @@ def get_meetings_for_chat(org_name, org_id, days, manager_id_list, report_id_lis
     if attendees_criteria:
         query["attendees"] = {"$all": attendees_criteria}
 
+    return query
+
+def get_meetings_for_chat(org_name, org_id, days, manager_id_list, report_id_list, collection_name="Meetings", type_name="One-on-One", projection=None):
+    """
+    Get all meetings held by a specific manager, regardless of type, within the last 'days' days,
+    returning only specific fields. Pass a projection to override the default
+    fields, which include raw_text.
+    """
+
+    # Connect to the database and collection
+    database = client[org_name]
+    collection = database[collection_name]
+
     # Query the collection with the constructed query and projection
     results = collection.find(
-        query,
-        {
+        meetings_for_chat_query(org_id, days, manager_id_list, report_id_list),
+        projection or {
             "type_name": 1,
             "meeting_duration": 1,
             "summary": 1,
@@ -299,7 +664,7 @@ def get_meetings_for_chat(org_name, org_id, days, manager_id_list, report_id_lis
 
     return list(unique_meetings.values())
 
-def get_one_on_ones(org_name, org_id, attendee_info, collection_name="Meetings"):
+def get_one_on_ones(org_name, org_id, attendee_info, projection=None, limit=None, after=None, collection_name="Meetings"):
     """
     Get all of a manager's one-on-one meetings with all employees
     """
@@ -309,7 +674,7 @@ def get_one_on_ones(org_name, org_id, attendee_info, collection_name="Meetings")
     database = client[org_name]
     collection = database[collection_name]
 
-    results = collection.find({
+    results = find_page(collection, {
         "type_name": "One-on-One",
         "org_id": org_id,
         "attendees": {
@@ -318,26 +683,22 @@ def get_one_on_ones(org_name, org_id, attendee_info, collection_name="Meetings")
             "role": "Manager"
         }
         }
-        })
+        }, projection, limit, after)
 
     return results
 
 
-# Get the number of meetings within the past month for a specific manager 
-def get_meetings_last_month(org_name, org_id, id, role="Manager", days=30, collection_name="Meetings"):
+def meetings_last_month_query(org_id, id, role="Manager", days=30):
     """
-    Get all meetings for a specific manager or employee within the past month.
+    Query for one-on-one meetings within the last 'days' days where the given
+    user attended with the given role.
     """
 
-    database = client[org_name]
-    collection = database[collection_name]
     # Calculate the date for one month ago
     one_month_ago = datetime.now() - timedelta(days=days)
-    print(one_month_ago)
-
 
     # Query to find meetings with the manager's user_id in attendees array and date within the past month
-    results = collection.find({
+    return {
         "type_name": "One-on-One",
         "org_id": org_id,
         "attendees": {
@@ -347,11 +708,98 @@ def get_meetings_last_month(org_name, org_id, id, role="Manager", days=30, colle
             }
         },
         "date": {"$gte": one_month_ago}
-    })
+    }
+
+# Get the number of meetings within the past month for a specific manager 
+def get_meetings_last_month(org_name, org_id, id, role="Manager", days=30, collection_name="Meetings"):
+    """
+    Get all meetings for a specific manager or employee within the past month.
+    """
+
+    database = client[org_name]
+    collection = database[collection_name]
+
+    results = collection.find(meetings_last_month_query(org_id, id, role, days))
 
     return list(results)
 
 
+def duration_seconds_expression():
+    """
+    Aggregation expression for a meeting's duration in seconds. Uses the stored
+    meeting_duration_seconds, falling back to parsing the "Xh Ym Zs" string
+    server-side for meetings saved before that field existed.
+    """
+
+    def part(index, unit):
+        return {"$convert": {
+            "input": {"$replaceAll": {"input": {"$arrayElemAt": ["$$parts", index]}, "find": unit, "replacement": ""}},
+            "to": "int",
+            "onError": 0,
+            "onNull": 0
+        }}
+
+    return {"$ifNull": ["$meeting_duration_seconds", {
+        "$let": {
+            "vars": {"parts": {"$split": [{"$ifNull": ["$meeting_duration", "0h 0m 0s"]}, " "]}},
+            "in": {"$add": [
+                {"$multiply": [part(0, "h"), 3600]},
+                {"$multiply": [part(1, "m"), 60]},
+                part(2, "s")
+            ]}
+        }
+    }]}
+
+def get_meeting_stats(org_name, org_id, role="Manager", days=30, user_ids=None, collection_name="Meetings"):
+    """
+    Count one-on-one meetings and average their duration for every user who
+    attended with the given role within the last 'days' days, in a single
+    aggregation. Returns {user_id: {"num_meetings": n, "average_length_minutes": m}}.
+    """
+
+    database = client[org_name]
+    collection = database[collection_name]
+
+    cutoff_date = datetime.now() - timedelta(days=days)
+
+    attendee_match = {"role": role}
+    if user_ids is not None:
+        attendee_match["user_id"] = {"$in": list(user_ids)}
+
+    pipeline = [
+        {"$match": {
+            "type_name": "One-on-One",
+            "org_id": org_id,
+            "attendees": {"$elemMatch": attendee_match},
+            "date": {"$gte": cutoff_date}
+        }},
+        {"$project": {"attendees": 1, "duration_seconds": duration_seconds_expression()}},
+        {"$unwind": "$attendees"},
+        {"$match": {f"attendees.{field}": value for field, value in attendee_match.items()}},
+        {"$group": {
+            "_id": "$attendees.user_id",
+            "num_meetings": {"$sum": 1},
+            "average_seconds": {"$avg": "$duration_seconds"}
+        }}
+    ]
+
+    stats = {}
+    for result in collection.aggregate(pipeline):
+        stats[result["_id"]] = {
+            "num_meetings": result["num_meetings"],
+            "average_length_minutes": round((result["average_seconds"] or 0) / 60, 2)
+        }
+
+    return stats
+
+def search_transcripts(org_name, org_id, meeting_ids, question, token_budget, top_k):
+    """
+    Get the transcript passages from the given meetings most relevant to a
+    question, within token_budget tokens. See transcript_index.search_chunks.
+    """
+
+    return transcript_index.search_chunks(client[org_name], org_id, meeting_ids, question, token_budget, top_k)
+
 def get_meeting_by_id(org_name, org_id, meeting_id, collection_name="Meetings"):
     """
     Get a specific meeting by it's id in the database.
@@ -411,6 +859,7 @@ def update_prompts(org_name, org_id, role, prompt_id, updated_data, scope, colle
     if role == "admin":
 
         result = collection.update_one(query_filter, update_operation)
+        bump_prompt_generation(org_name, org_id)
 
         return result
 
@@ -425,38 +874,52 @@ def duration_to_seconds(duration_str):
     seconds = int(parts[2].replace("s", ""))
     return hours * 3600 + minutes * 60 + seconds
 
-def fetch_meeting_types(org_name, org_id, scope, collection_name="MeetingTypes"):
+def meeting_types_query(org_id, scope):
     """
-    Get all available meeting types as a list
+    Query for the company-wide meeting types plus those added for a scope.
     """
 
-    # TODO - This can be simplified without requesting all this data.
-
-    database = client[org_name]
-    collection = database[collection_name]
-
-    result = collection.find({
+    return {
             "org_id": org_id,
             "$or": [
                 {"scope": "company_wide"},
                 {"scope": scope}
             ]
-        })
-    
-    return [result["type_name"] for result in result]
+        }
 
-def get_general_meetings(meeting_type, org_name, org_id, attendee_info, collection_name="Meetings"):
+def fetch_meeting_types(org_name, org_id, scope, collection_name="MeetingTypes"):
+    """
+    Get all available meeting types as a list. Cached until the org's
+    meeting types change.
+    """
+
+    cache_key = (org_name, org_id, "meeting_types", str(scope), get_prompt_generation(org_name, org_id))
+    cached = prompt_cache.get(cache_key)
+    if cached is not None:
+        return list(cached)
+
+    database = client[org_name]
+    collection = database[collection_name]
+
+    result = collection.find(meeting_types_query(org_id, scope), {"type_name": 1})
+    meeting_types = [result["type_name"] for result in result]
+
+    prompt_cache.store(cache_key, tuple(meeting_types))
+
+    return meeting_types
+
+def get_general_meetings(meeting_type, org_name, org_id, attendee_info, projection=None, limit=None, after=None, collection_name="Meetings"):
 
     database = client[org_name]
     collection = database[collection_name]
 
-    results = collection.find({
+    results = find_page(collection, {
         "type_name": meeting_type,
         "org_id": org_id,
         "attendees": {
             "$elemMatch": attendee_info
         }
-    })
+    }, projection, limit, after)
 
     return results
 
@@ -485,12 +948,14 @@ def add_new_meeting_type(org_name, org_id, role, meeting_type_data, scope="compa
         }
 
         result = collection.update_one(query_filter, update_operation)
+        bump_prompt_generation(org_name, org_id)
         return {"updated": True, "result": result}
 
     meeting_type_data["org_id"] = org_id
     meeting_type_data["scope"] = scope
     meeting_type_data["access_level"] = role
     result = collection.insert_one(meeting_type_data)
+    bump_prompt_generation(org_name, org_id)
 
     return result
 
@@ -522,6 +987,7 @@ def delete_prompts(org_name, org_id, role, prompt_id, scope, collection_name="Me
     }
     
     result = collection.delete_one(query_filter)
+    bump_prompt_generation(org_name, org_id)
 
     return result
     
@@ -538,12 +1004,12 @@ def get_meeting_data(org_name, org_id, meeting_id, collection_name="Meetings"):
 
     return result
 
-def get_all_one_on_ones(org_name, org_id, report_id, collection_name="Meetings"):
+def get_all_one_on_ones(org_name, org_id, report_id, projection=None, limit=None, after=None, collection_name="Meetings"):
 
     database = client[org_name]
     collection = database[collection_name]
 
-    result = collection.find({
+    result = find_page(collection, {
         "org_id": org_id,
         "type_name": "One-on-One", 
         "attendees": {
@@ -551,19 +1017,26 @@ def get_all_one_on_ones(org_name, org_id, report_id, collection_name="Meetings")
                 "role": "Report",
                 "user_id": report_id
             }}
-    })
+    }, projection, limit, after)
 
     return list(result)
 
-def get_recent_meetings(org_name, org_id, meeting_type, limit=10, collection_name="Meetings"):
-    database = client[org_name]
-    collection = database[collection_name]
+def recent_meetings_query(org_id, meeting_type):
+    """
+    Query for meetings of a type that have a transcript.
+    """
 
-    result = collection.find({
+    return {
         "org_id": org_id,
         "type_name": meeting_type,
          "raw_text": {"$exists": True}
-    }).sort("date", -1).limit(limit)  # Sort by 'meeting_date' in descending order and limit to 10
+    }
+
+def get_recent_meetings(org_name, org_id, meeting_type, limit=10, projection=None, collection_name="Meetings"):
+    database = client[org_name]
+    collection = database[collection_name]
+
+    result = collection.find(recent_meetings_query(org_id, meeting_type), projection).sort("date", -1).limit(limit)  # Sort by 'meeting_date' in descending order and limit to 10
 
     return list(result)
 
@@ -573,11 +1046,16 @@ def update_document_with_raw_text(org_name, document_id, raw_text, collection_na
 
     result = collection.update_one(
         {"_id": ObjectId(document_id)},  # Use ObjectId to query the _id field
-        {"$set": {"raw_text": raw_text}}  # Update or add the 'raw_text' field
+        {"$set": {"raw_text": raw_text}, "$inc": {"version": 1}}  # Update or add the 'raw_text' field
     )
     
     if result.matched_count > 0:
         print(f"Document with id {document_id} was successfully updated.")
+        response_cache.invalidate_meeting(document_id)
+
+        # The transcript changed, so rebuild its chunks
+        meeting = collection.find_one({"_id": ObjectId(document_id)}, {"org_id": 1, "date": 1, "type_name": 1, "raw_text": 1})
+        transcript_index.index_meeting(database, meeting, collection_name)
     else:
         print(f"No document found with id {document_id}.")
 
@@ -587,11 +1065,21 @@ def update_notes(org_name, document_id, notes, collection_name="Meetings"):
 
     result = collection.update_one(
         {"_id": ObjectId(document_id)},  # Use ObjectId to query the _id field
-        {"$set": {"summary.Notes": notes}}  # Update or add the 'Notes' field within 'summary'
+        {"$set": {"summary.Notes": notes}, "$inc": {"version": 1}}  # Update or add the 'Notes' field within 'summary'
     )
 
     if result.modified_count > 0:
         print(f"Successfully updated document with id {document_id}.")
+
+        # The digest embeds the summary, so rebuild it with the new notes
+        meeting = collection.find_one({"_id": ObjectId(document_id)}, {"summary": 1, "digest": 1})
+        condensed_transcript = (meeting.get("digest") or {}).get("condensed_transcript")
+        collection.update_one(
+            {"_id": ObjectId(document_id)},
+            {"$set": {"digest": meeting_digest.build_digest(meeting.get("summary"), condensed_transcript)}}
+        )
+
+        response_cache.invalidate_meeting(document_id)
     else:
         print(f"No document found with id {document_id} or no update needed.")
 
@@ -618,12 +1106,95 @@ def delete_meeting(org_name, org_id, meeting_id, role, collection_name="Meetings
     if role == "admin":
         # Perform deletion
         result = collection.delete_one(query_filter)
+        if result.deleted_count > 0:
+            transcript_index.delete_meeting_chunks(database, meeting_id)
         return result
     else:
         logging.error("User does not have permission to delete meetings")
         return None
     
 
+# Indexes every org database should have, per collection. The Meetings
+# indexes on attendees.* are multikey since attendees is an array.
+# The trailing _id on the Meetings indexes lets keyset pages (PAGE_SORT) be
+# read straight off the index.
+ORG_INDEXES = {
+    "Meetings": [
+        {"name": "org_type_attendee_date",
+         "keys": [("org_id", 1), ("type_name", 1), ("attendees.user_id", 1), ("attendees.role", 1), ("date", -1), ("_id", -1)]},
+        {"name": "org_attendee_date",
+         "keys": [("org_id", 1), ("attendees.user_id", 1), ("attendees.role", 1), ("date", -1), ("_id", -1)]},
+        {"name": "org_type_date",
+         "keys": [("org_id", 1), ("type_name", 1), ("date", -1), ("_id", -1)]},
+        {"name": "pipeline_run",
+         "keys": [("pipeline_run_id", 1)],
+         "options": {"unique": True, "sparse": True}},
+    ],
+    transcript_index.CHUNKS_COLLECTION: [
+        {"name": "org_meeting_chunk",
+         "keys": [("org_id", 1), ("meeting_id", 1), ("chunk_index", 1)]},
+        {"name": "org_term_meeting",
+         "keys": [("org_id", 1), ("terms.t", 1), ("meeting_id", 1)]},
+    ],
+    "MeetingTypes": [
+        {"name": "org_scope_type",
+         "keys": [("org_id", 1), ("scope", 1), ("type_name", 1)]},
+    ],
+}
+
+def ensure_indexes(org_name):
+    """
+    Create any missing indexes for an org database. create_index is a no-op
+    for indexes that already exist, so this is safe to run on every startup.
+    """
+
+    database = client[org_name]
+
+    for collection_name, indexes in ORG_INDEXES.items():
+        collection = database[collection_name]
+        for index in indexes:
+            collection.create_index(index["keys"], name=index["name"], **index.get("options", {}))
+
+    logging.info(f"Indexes ensured for {org_name}")
+
+def verify_indexes(org_name):
+    """
+    Check an org database against ORG_INDEXES. Returns a list of
+    "collection.index_name" entries that are missing or have different keys.
+    """
+
+    database = client[org_name]
+    problems = []
+
+    for collection_name, indexes in ORG_INDEXES.items():
+        existing = database[collection_name].index_information()
+
+        for index in indexes:
+            found = existing.get(index["name"])
+            if not found or [tuple(key) for key in found["key"]] != index["keys"]:
+                problems.append(f"{collection_name}.{index['name']}")
+
+    return problems
+
+def ensure_indexes_for_orgs(org_names):
+    """
+    Ensure and verify indexes for several org databases, logging rather than
+    raising so one bad org doesn't stop the others.
+    """
+
+    get_recording_sessions_collection()
+
+    for org_name in org_names:
+        try:
+            ensure_indexes(org_name)
+
+            problems = verify_indexes(org_name)
+            if problems:
+                logging.warning(f"Index verification failed for {org_name}: {problems}")
+
+        except Exception as e:
+            logging.error(f"Failed to ensure indexes for {org_name}: {e}")
+
 def mongo_org_setup(org_name, org_id):
 
     # Get demo organization meeting types for copying to the new database
@@ -649,9 +1220,11 @@ def mongo_org_setup(org_name, org_id):
         new_type_collection.insert_many(documents)
 
         print(f"Inserted {len(documents)} documents into {new_type_collection.name}")
+        bump_prompt_generation(org_name, org_id)
     else:
         print("No documents found in the source collection.")
 
+    ensure_indexes(org_name)
     
     return "success"
 
@@ -0,0 +1,109 @@
+import sys
+import logging
+from pymongo.mongo_client import MongoClient
+from pymongo.server_api import ServerApi
+from app.utils.mongo import (uri, ensure_indexes, verify_indexes, oneonone_meetings_query, meetings_last_month_query,
+                             meetings_for_chat_query, recent_meetings_query, meeting_types_query)
+
+# explain isn't part of the strict Stable API the app's client uses, so
+# diagnostics get their own non-strict client
+client = MongoClient(uri, server_api=ServerApi(version="1", strict=False))
+
+def find_stages(plan):
+    """
+    Collect every stage name in an explain() query plan, walking nested input
+    stages.
+    """
+
+    stages = [plan.get("stage")]
+
+    if "inputStage" in plan:
+        stages += find_stages(plan["inputStage"])
+
+    for child in plan.get("inputStages", []):
+        stages += find_stages(child)
+
+    return stages
+
+def explain_query(collection, query, sort=None):
+    """
+    Run explain() for a query and summarize how it was executed.
+    """
+
+    cursor = collection.find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+
+    explanation = cursor.explain()
+
+    winning_plan = explanation["queryPlanner"]["winningPlan"]
+    stages = find_stages(winning_plan.get("queryPlan", winning_plan))
+    stats = explanation.get("executionStats", {})
+
+    return {
+        "stages": stages,
+        "collection_scan": "COLLSCAN" in stages,
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "returned": stats.get("nReturned"),
+    }
+
+def explain_org_queries(org_name, org_id):
+    """
+    Run explain() on the query behind each of the main query helpers for an
+    org, using a sample meeting's attendees as parameters. Returns a dict of
+    helper name to plan summary.
+    """
+
+    database = client[org_name]
+    meetings = database["Meetings"]
+    meeting_types = database["MeetingTypes"]
+
+    # Use a real one-on-one so the queries exercise realistic values
+    sample = meetings.find_one({"org_id": org_id, "type_name": "One-on-One"}, {"attendees": 1}) or {}
+    attendees = sample.get("attendees", [])
+    manager_id = next((a["user_id"] for a in attendees if a.get("role") == "Manager"), 0)
+    report_id = next((a["user_id"] for a in attendees if a.get("role") == "Report"), 0)
+
+    queries = {
+        "get_meetings_last_month": (meetings, meetings_last_month_query(org_id, manager_id, "Manager", 30), None),
+        "get_oneonone_meetings": (meetings, oneonone_meetings_query("One-on-One", org_id, {"manager_id": manager_id, "report_id": report_id}), None),
+        "get_meetings_for_chat": (meetings, meetings_for_chat_query(org_id, 365, [manager_id], [report_id]), None),
+        "get_recent_meetings": (meetings, recent_meetings_query(org_id, "One-on-One"), [("date", -1)]),
+        "fetch_meeting_types": (meeting_types, meeting_types_query(org_id, manager_id), None),
+    }
+
+    return {name: explain_query(collection, query, sort) for name, (collection, query, sort) in queries.items()}
+
+def report_org_queries(org_name, org_id):
+    """
+    Print an explain() summary for each query helper, flagging collection scans.
+    """
+
+    missing = verify_indexes(org_name)
+    if missing:
+        print(f"Missing indexes for {org_name}: {missing}")
+
+    results = explain_org_queries(org_name, org_id)
+
+    for name, result in results.items():
+        flag = "COLLSCAN" if result["collection_scan"] else "ok"
+        print(f"[{flag}] {name}: stages={result['stages']} keys_examined={result['keys_examined']} "
+              f"docs_examined={result['docs_examined']} returned={result['returned']}")
+
+    return results
+
+if __name__ == "__main__":
+    # python -m app.utils.mongo_diagnostics ensure <org_name>
+    # python -m app.utils.mongo_diagnostics explain <org_name> <org_id>
+    logging.basicConfig(level=logging.INFO)
+
+    command, org_name = sys.argv[1], sys.argv[2]
+
+    if command == "ensure":
+        ensure_indexes(org_name)
+        print(f"Missing indexes after ensure: {verify_indexes(org_name)}")
+    elif command == "explain":
+        report_org_queries(org_name, int(sys.argv[3]))
+    else:
+        print(f"Unknown command {command}")
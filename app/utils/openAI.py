@@ -1,13 +1,20 @@
 from dotenv import load_dotenv
-from openai import OpenAI, OpenAIError
+from openai import OpenAI, OpenAIError, LengthFinishReasonError
 import subprocess
-import math
+import glob
 import os
 from pathlib import Path
 import time
-from pydub import AudioSegment
 from app.utils.mongo import get_prompts, add_meeting, get_meeting_data, get_all_one_on_ones, get_all_manager_meetings, get_general_meetings, get_all_employee_meetings
+from app.utils.meeting_digest import DIGEST_TARGET_TOKENS, DIGEST_PROJECTION, build_digest, meeting_digest, render_summary
+from app.utils.transcript_index import count_tokens, truncate_tokens, chunk_transcript
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from app.utils import response_cache
+from app.utils.voice_activity import trim_silence, extract_speech_chunks
+from app.utils.media_probe import probe_duration
 import json
+from io import BytesIO
 from pydantic import create_model
 from typing import List
 from urllib.parse import urlparse
@@ -20,26 +27,31 @@ logging.basicConfig(
 )
 
 def get_audio_duration(file_path):
+    """
+    Duration in seconds of an audio file path or in-memory buffer, read by
+    media_probe without decoding the audio. Returns 0 if it cannot be read,
+    so the file is skipped.
+    """
+
     try:
-        # Load the audio file using pydub
-        audio = AudioSegment.from_file(file_path)
-        
-        # Get duration in seconds
-        duration = len(audio) / 1000  # pydub gives duration in milliseconds
-        return duration
-    
-    except Exception as e:
-        print(f"Error getting duration: {e}")
-        return 0  # Return 0 if there's an error, to skip the file
-    
-    except ValueError as e:
-        print(f"Could not convert duration to float: {e}")
-        return 0
+        source = file_path.getvalue() if isinstance(file_path, BytesIO) else file_path
+        return probe_duration(source)
+
     except Exception as e:
         print(f"Error getting duration: {e}")
         return 0  # Return 0 if there's an error, to skip the file
 
 def create_meeting_summary_model(categories):
+    return summary_model_for(tuple(categories))
+
+@lru_cache(maxsize=256)
+def summary_model_for(categories):
+    """
+    Build the MeetingSummary schema for a set of categories. Models are
+    cached by their categories, so a meeting type's schema is only built
+    once per process and changes whenever its prompts do.
+    """
+
     fields = {}
     for category in categories:
         # Assuming all fields are strings; adjust the type as necessary
@@ -47,196 +59,225 @@ def create_meeting_summary_model(categories):
     MeetingSummary = create_model('MeetingSummary', **fields)
     return MeetingSummary
 
+# Recall audio is cut into chunks of this many seconds for Whisper, encoded
+# as 16 kHz mono Opus, which is plenty for speech and a fraction of the size
+# of PCM WAV
+MEDIA_SEGMENT_SECONDS = int(os.getenv("MEDIA_SEGMENT_SECONDS", 120))
+MEDIA_SEGMENT_BITRATE = os.getenv("MEDIA_SEGMENT_BITRATE", "24k")
+MEDIA_SEGMENT_FORMAT = "ogg"
+
+# Drop silence before sending audio to Whisper, so dead air is not billed
+# and chunks are cut at pauses instead of mid-word
+VOICE_ACTIVITY_TRIMMING = os.getenv("VOICE_ACTIVITY_TRIMMING", "true").lower() == "true"
+
+# Trimming browser chunks means an ffmpeg decode, the VAD and an ffmpeg encode
+# per chunk on the eventlet transcription workers, so it is opt-in. Recall
+# audio is trimmed while it is split, on the prefork media workers.
+CHUNK_VOICE_ACTIVITY_TRIMMING = os.getenv("CHUNK_VOICE_ACTIVITY_TRIMMING", "false").lower() == "true"
+
+# Transcripts longer than SUMMARY_CONTEXT_TOKENS are summarized in windows of
+# SUMMARY_WINDOW_TOKENS, up to SUMMARY_WORKERS at once, and the window
+# summaries are then combined
+SUMMARY_MODEL = "gpt-4o-2024-08-06"
+SUMMARY_CONTEXT_TOKENS = int(os.getenv("SUMMARY_CONTEXT_TOKENS", 60000))
+SUMMARY_WINDOW_TOKENS = int(os.getenv("SUMMARY_WINDOW_TOKENS", 20000))
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", 4))
+SUMMARY_MAX_DEPTH = 3
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 client = OpenAI(api_key=OPENAI_API_KEY)
 
-def transcribe_webm(full_path, username):
+def transcribe_webm_bytes(audio_bytes, filename):
+    """
+    Transcribe an in-memory webm chunk and return its text. The bytes are sent
+    to Whisper as a file-like buffer, so nothing is written to disk. With
+    CHUNK_VOICE_ACTIVITY_TRIMMING only the speech is sent, as Opus.
+    """
+
+    # Check duration before transcription
+    duration = get_audio_duration(BytesIO(audio_bytes))
+    if duration < 0.1:
+        print("Duration under 0.1.")
+        raise ValueError("Audio file is too short for transcription.")
+
+    if CHUNK_VOICE_ACTIVITY_TRIMMING:
+        transcription = client.audio.transcriptions.create(
+            model="whisper-1",
+            file=(f"{os.path.splitext(filename)[0]}.ogg", BytesIO(trim_silence(audio_bytes, MEDIA_SEGMENT_BITRATE)))
+        )
 
-    try:
+        return transcription.text
 
-        # Check duration before transcription
-        duration = get_audio_duration(full_path)
-        if duration < 0.1:
-            print("Duration under 0.1.")
-            raise ValueError("Audio file is too short for transcription.")
-        
-        # Attempt transcription
-        with open(f"{full_path}", "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
-                model="whisper-1", 
-                file=audio_file
-            )
-
-    except OpenAIError as e:
-        if "Invalid file format" in str(e):
-            # Re-encode the file using FFmpeg
-            temp_output_path = full_path.replace(".webm", "_reencoded.webm")
-            subprocess.run([
-                "ffmpeg", "-i", full_path, "-c:a", "libvorbis", temp_output_path
-            ], check=True,  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            
-            # Replace the original file with the re-encoded file
-            os.replace(temp_output_path, full_path)
-
-            # Retry transcription with the re-encoded file
-            with open(full_path, "rb") as audio_file:
-                transcription = client.audio.transcriptions.create(
-                    model="whisper-1", 
-                    file=audio_file
-                )
-        else:
-            # Re-raise the exception if it's not related to file format
-            raise e
-
-    print("Grabbing transcription text")
-    body = transcription.text
-
-    path_parts = os.path.normpath(full_path).split(os.sep)
-    tmp, webm, user, report, date, file = path_parts
-
-    num = file.split(".")[0]
-
-    folder_file_path = os.path.join(f"tmp_{username}", "transcribed_chunks", user, report, date)
-    local_file_path = os.path.join(folder_file_path,  f"{num}.txt")
-
-    if not os.path.exists(folder_file_path):
-        os.makedirs(folder_file_path)
-
-    # Write the text to the file
-    with open(local_file_path, 'w', encoding="utf-8") as file:
-        file.write(body)
-
-def transcribe_mp4(video_filepath):
-    try:
-        # Extract audio from the video file
-        audio_filepath = video_filepath.replace('.mp4', '.wav')
+    # Chunks are normalized to standalone webm files at ingest, so they are
+    # sent as they are
+    transcription = client.audio.transcriptions.create(
+        model="whisper-1",
+        file=(filename, BytesIO(audio_bytes))
+    )
 
-        # Use ffmpeg to extract audio
-        try:
-            subprocess.run([
-                "ffmpeg", "-i", video_filepath, "-vn", "-acodec", "pcm_s16le",
-                "-ar", "44100", "-ac", "1", audio_filepath  # Use mono to reduce file size
-            ], check=True)
-            logging.info(f"Audio extracted to {audio_filepath}")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"ffmpeg failed to extract audio: {e}")
-            return ""
-
-        # Check if the audio file was created
-        if not os.path.isfile(audio_filepath) or os.path.getsize(audio_filepath) == 0:
-            logging.error(f"Audio file was not created or is empty: {audio_filepath}")
-            return ""
-
-        # Split audio into chunks under 25MB
-        chunk_length_ms = 120 * 1000  # 2 minutes in milliseconds
-        audio = AudioSegment.from_wav(audio_filepath)
-        audio_duration_ms = len(audio)
-        num_chunks = math.ceil(audio_duration_ms / chunk_length_ms)
-
-        transcriptions = []
-
-        for i in range(num_chunks):
-            start_ms = i * chunk_length_ms
-            end_ms = min((i + 1) * chunk_length_ms, audio_duration_ms)
-            chunk = audio[start_ms:end_ms]
-
-            chunk_filename = f"{audio_filepath}_chunk_{i}.wav"
-            chunk.export(chunk_filename, format="wav")
-
-            # Transcribe the audio chunk
-            with open(chunk_filename, "rb") as audio_file:
-                logging.info(f"Transcribing audio chunk {chunk_filename}")
-                try:
-                    transcription = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file,
-                        language="en"
-                    )
-
-                    transcriptions.append(transcription.text)
-                except OpenAIError as e:
-                    logging.error(f"OpenAI API error while transcribing {chunk_filename}: {e}")
-                    transcriptions.append("")
-                except Exception as e:
-                    logging.error(f"Unexpected error during transcription of {chunk_filename}: {e}")
-                    transcriptions.append("")
-
-            # Optionally, delete the chunk file after transcription
-            os.remove(chunk_filename)
-
-        # Combine all transcriptions
-        full_transcription = ' '.join(transcriptions)
-
-        # Optionally, delete the audio file after transcription
-        os.remove(audio_filepath)
-
-        return full_transcription
+    return transcription.text
 
-    except Exception as e:
-        logging.error(f"Error processing MP4 file {video_filepath}: {e}")
-        return ""
-
-
-def summarize_meeting(input_file, output_file, username):
-    with open(input_file, 'r', encoding="utf-8") as file:
-        # Read the entire content of the file
-        content = file.read()
-
-    system_prompt = """Please analyze the following 1:1 meeting transcript and provide a detailed summary. The summary should include the following:
-                        Tone of the Meeting: Describe the overall mood and atmosphere during the meeting. Was it collaborative, tense, productive, casual, etc.?
-                        Key Takeaways: Identify the most important points discussed during the meeting. What were the main themes or topics covered?
-                        Action Items: List all the action items that were agreed upon, including who is responsible for each and any deadlines mentioned.
-                        Decisions Made: Highlight any decisions or agreements that were reached during the meeting. Include the rationale behind these decisions if discussed.
-                        Concerns or Challenges: Note any concerns, challenges, or issues that were raised during the meeting, along with any proposed solutions or next steps.
-                        Opportunities: Identify any potential opportunities that were discussed or hinted at during the meeting, whether for improvement, growth, or new initiatives.
-                        Additional Notes: Include any other relevant information that could help in understanding the full context and outcomes of the meeting."""
-
-    def generate_meeting_notes(temperature, system_prompt, model):
-        response = client.chat.completions.create(
-            model=model,
-            temperature=temperature,
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ]
-        )
+def transcribe_audio_bytes(audio_bytes, filename):
+    """
+    Transcribe an in-memory audio file in a format Whisper accepts as is.
+    """
 
-        return [response.choices[0].message.content, response.usage.prompt_tokens, response.usage.completion_tokens]
-            
-    model = "gpt-4o"
+    transcription = client.audio.transcriptions.create(
+        model="whisper-1",
+        file=(filename, BytesIO(audio_bytes)),
+        language="en"
+    )
+
+    return transcription.text
+
+def split_mp4_audio(video_filepath, segment_seconds=MEDIA_SEGMENT_SECONDS):
+    """
+    Extract the audio from a video straight into 16 kHz mono Opus chunks of
+    at most segment_seconds each, written next to the video. ffmpeg's segment
+    muxer streams the audio, so memory use does not grow with the length of
+    the meeting. With voice activity trimming, silence is dropped and chunks
+    are cut at pauses. Returns the chunk paths in order. This is CPU heavy,
+    so it runs on the media queue.
+    """
+
+    chunk_pattern = f"{os.path.splitext(video_filepath)[0]}_chunk_%04d.{MEDIA_SEGMENT_FORMAT}"
+
+    if VOICE_ACTIVITY_TRIMMING:
+        extract_speech_chunks(video_filepath, chunk_pattern, segment_seconds, MEDIA_SEGMENT_BITRATE)
+    else:
+        subprocess.run([
+            "ffmpeg", "-nostdin", "-loglevel", "error", "-i", video_filepath, "-vn",
+            "-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", MEDIA_SEGMENT_BITRATE, "-application", "voip",
+            "-f", "segment", "-segment_time", str(segment_seconds), "-reset_timestamps", "1",
+            chunk_pattern
+        ], check=True)
+
+    chunk_paths = sorted(glob.glob(chunk_pattern.replace("%04d", "[0-9]" * 4)))
+
+    if not chunk_paths:
+        raise RuntimeError(f"ffmpeg produced no audio chunks for {video_filepath}")
+
+    logging.info(f"Split the audio of {video_filepath} into {len(chunk_paths)} chunks")
+
+    return chunk_paths
+
+def condense_transcript(content):
+    """
+    Condense a transcript to roughly DIGEST_TARGET_TOKENS tokens, keeping the
+    specifics (names, numbers, commitments) chat questions tend to ask about.
+    """
+
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        temperature=0,
+        messages=[
+            {
+                "role": "system",
+                "content": f"Condense the following meeting transcript into about {DIGEST_TARGET_TOKENS} tokens of plain prose. "
+                           "Keep who said what, names, numbers, dates, decisions and commitments. Do not add anything that was not said."
+            },
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
+    )
+
+    return response.choices[0].message.content
+
+def parse_summary(system_prompt, content, MeetingSummary):
+    """
+    One structured summary call. Returns None if the model refuses, and
+    raises LengthFinishReasonError if the response is cut off.
+    """
+
+    response = client.beta.chat.completions.parse(
+        model=SUMMARY_MODEL,
+        temperature=0,
+        messages=[
+            {
+                "role": "system",
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": content
+            }
+        ],
+        response_format=MeetingSummary
+    )
+    message = response.choices[0].message
 
-    transcribed_text, prompt_tokens, completion_tokens = generate_meeting_notes(0, system_prompt, model)
+    if message.refusal:
+        logging.warning(f"Model refused to provide a response: {message.refusal}")
 
+    return message.parsed
 
-    folder_file_path = os.path.join(f"tmp_{username}", "summarized_meeting")
-    local_file_path = os.path.join(folder_file_path,  output_file)
+def within_budget(content, tokens):
+    """
+    Cut content down to SUMMARY_CONTEXT_TOKENS when it can not be split any
+    further, so the model call fails neither on context length nor silently.
+    """
 
-    if not os.path.exists(folder_file_path):
-        os.makedirs(folder_file_path)
+    if tokens <= SUMMARY_CONTEXT_TOKENS:
+        return content
 
-    # Write the text to the file
-    with open(local_file_path, 'w') as file:
-        file.write(transcribed_text)
+    logging.warning(f"{tokens} tokens could not be split under the {SUMMARY_CONTEXT_TOKENS} token budget, "
+                    f"summarizing only the first {SUMMARY_CONTEXT_TOKENS}.")
 
-def summarize_meeting_improved(input_file, output_file, username, org_name, org_id, type_name, meeting_name, user_id, attendees, meeting_duration):
+    return truncate_tokens(content, SUMMARY_CONTEXT_TOKENS)
+
+def summarize_transcript(system_prompt, content, MeetingSummary, depth=0):
+    """
+    Summarize a transcript into the MeetingSummary schema. A transcript over
+    SUMMARY_CONTEXT_TOKENS, or one whose summary gets cut off, is split into
+    windows on sentence boundaries that are summarized in parallel (map).
+    The window summaries are then combined into one summary with the same
+    schema (reduce). Text still over the budget once it cannot be split, at
+    SUMMARY_MAX_DEPTH or as a single sentence, is truncated.
+    """
+
+    tokens = count_tokens(content)
+
+    if tokens <= SUMMARY_CONTEXT_TOKENS or depth >= SUMMARY_MAX_DEPTH:
+        try:
+            return parse_summary(system_prompt, within_budget(content, tokens), MeetingSummary)
+        except LengthFinishReasonError:
+            if depth >= SUMMARY_MAX_DEPTH:
+                raise
+            logging.warning(f"Summary of {tokens} tokens was cut off, summarizing it in windows instead.")
+
+    windows = [text for text, _ in chunk_transcript(content, min(SUMMARY_WINDOW_TOKENS, tokens // 2 + 1))]
+    if len(windows) < 2:
+        return parse_summary(system_prompt, within_budget(content, tokens), MeetingSummary)
+
+    logging.info(f"Summarizing {tokens} tokens in {len(windows)} windows.")
+
+    with ThreadPoolExecutor(max_workers=min(SUMMARY_WORKERS, len(windows))) as executor:
+        partials = list(executor.map(lambda window: summarize_transcript(system_prompt, window, MeetingSummary, depth + 1), windows))
+
+    partials = [partial for partial in partials if partial]
+    if not partials:
+        return None
+
+    reduce_prompt = (f"{system_prompt}\n\nThe meeting was summarized in consecutive parts. Below are the summaries of "
+                     "each part, in order. Combine them into one summary of the whole meeting, merging repeated points "
+                     "and keeping every action item, decision and concern.")
+    part_summaries = "\n\n".join(f"Part {number} of {len(partials)}:\n{render_summary(partial.model_dump())}"
+                                  for number, partial in enumerate(partials, start=1))
+
+    return summarize_transcript(reduce_prompt, part_summaries, MeetingSummary, depth + 1)
+
+def summarize_meeting_improved(content, output_file, username, org_name, org_id, type_name, meeting_name, user_id, attendees, meeting_duration, pipeline_run_id=None):
+    """
+    Summarize a meeting transcript and store it in the database. output_file
+    only names the meeting in logs. Pipeline runs pass their run id so the
+    meeting is saved at most once.
+    """
     
-    logging.debug(f"Function called with input_file={input_file}, output_file={output_file}, username={username}, org_name={org_name}, "
+    logging.debug(f"Function called with output_file={output_file}, username={username}, org_name={org_name}, "
                   f"org_id={org_id}, type_name={type_name}, meeting_name={meeting_name}, user_id={user_id}, attendees={attendees}, "
                   f"meeting_duration={meeting_duration}")
-    
-    try:
-        with open(input_file, 'r', encoding="utf-8") as file:
-            content = file.read()
-            logging.debug(f"Read content from input file {input_file}")
-    except Exception as e:
-        logging.error(f"Error reading input file {input_file}: {e}")
-        return None
 
     try:
         system_prompt, categories = get_prompts(org_name=org_name,
@@ -260,58 +301,35 @@ def summarize_meeting_improved(input_file, output_file, username, org_name, org_
         logging.error(f"Error creating MeetingSummary model: {e}")
         return None
     
-    model = "gpt-4o-2024-08-06"
-    temperature = 0
-
     try:
         logging.debug(f"Calling GPT model with system prompt and content.")
-        response = client.beta.chat.completions.parse(
-            model=model,
-            temperature=temperature,
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ],
-            response_format=MeetingSummary
-        )
-        message = response.choices[0].message
+        parsed_response = summarize_transcript(system_prompt, content, MeetingSummary)
         logging.debug(f"Response received from GPT model.")
 
-        if message.parsed:
-            parsed_response = message.parsed
+        if parsed_response:
             parsed_dict = parsed_response.model_dump()
             logging.debug(f"Parsed response: {parsed_dict}")
 
-            # Proceed to store in database
-            add_meeting(org_name, org_id, content, parsed_dict, attendees, meeting_duration, type_name, meeting_name, collection_name="Meetings")
-            logging.debug("Meeting successfully added to the database.")
-
-            # Write the structured JSON to the file
-            folder_file_path = os.path.join(f"tmp_{username}", "summarized_meeting")
-            local_file_path = os.path.join(folder_file_path, output_file)
-
-            if not os.path.exists(folder_file_path):
-                os.makedirs(folder_file_path)
-                logging.debug(f"Created directory {folder_file_path}")
+            # Digest chat uses instead of the raw transcript. Without a
+            # condensed transcript it still carries the summary.
+            try:
+                condensed_transcript = condense_transcript(content)
+            except Exception as e:
+                logging.error(f"Error condensing transcript for digest: {e}")
+                condensed_transcript = None
+            digest = build_digest(parsed_dict, condensed_transcript)
 
-            with open(local_file_path, 'w') as file:
-                file.write(parsed_response.model_dump_json())
-                logging.debug(f"Summarized meeting written to {local_file_path}")
+            # Proceed to store in database
+            add_meeting(org_name, org_id, content, parsed_dict, attendees, meeting_duration, type_name, meeting_name, collection_name="Meetings", digest=digest,
+                        pipeline_run_id=pipeline_run_id)
+            logging.debug(f"Meeting {output_file} successfully added to the database.")
 
             return parsed_dict
 
-        elif message.refusal:
-            logging.warning("Model refused to provide a response.")
-            return None
+        return None
 
-    except OpenAIError.LengthFinishReasonError:
-        logging.error("Response was cut off due to max tokens. Consider increasing 'max_tokens'.")
+    except LengthFinishReasonError:
+        logging.error("Response was cut off due to max tokens, even when summarized in windows.")
         return None
     except Exception as e:
         logging.error(f"An error occurred during the GPT request or response handling: {e}")
@@ -319,22 +337,31 @@ def summarize_meeting_improved(input_file, output_file, username, org_name, org_
 
 
 
-def generate_ai_reply(messages, user_id, org_name, org_id, days, employee_ids, manager_ids=None):
+def generate_ai_reply(messages, user_id, org_name, org_id, days, employee_ids, manager_ids=None, use_transcripts=False):
 
     content = "Please help the user answer the question they ask using the following data. Answer the question thouroughly, but in as few sentences as possible. No bullet points or lists."
 
-    # Add meetings to content by iterating through employees and managers
+    # Meetings are described by their digests unless full transcripts are asked for
+    projection = None if use_transcripts else DIGEST_PROJECTION
+
+    meetings = []
     if employee_ids:
         for employee_id in employee_ids:
             attendee_info = {"employee_id": employee_id}
-            emp_meetings = get_all_employee_meetings(org_name, org_id, days, attendee_info)
-            content += str(emp_meetings)
+            meetings += get_all_employee_meetings(org_name, org_id, days, attendee_info, projection=projection)
 
     if manager_ids:
         for manager_id in manager_ids:
             attendee_info = {"manager_id": manager_id}
-            man_meetings = get_all_manager_meetings(org_name, org_id, days, attendee_info)
-            content += str(man_meetings)
+            meetings += get_all_manager_meetings(org_name, org_id, days, attendee_info, projection=projection)
+
+    # Add meetings to content
+    if use_transcripts:
+        content += str(meetings)
+    else:
+        for meeting in meetings:
+            date_str = meeting["date"].strftime("%m-%d-%Y") if meeting.get("date") else "Unknown Date"
+            content += f" {meeting.get('type_name', 'Meeting')} on {date_str}: {meeting_digest(meeting)['text']}"
 
     ai_messages = [
         {"role": "system", "content": content},
@@ -357,13 +384,24 @@ def generate_ai_reply(messages, user_id, org_name, org_id, days, employee_ids, m
 
     return ai_assistance
 
-def generate_ai_reply_for_meeting(prompt, meeting_id, user_id, org_name, org_id):
+def generate_ai_reply_for_meeting(prompt, meeting_id, user_id, org_name, org_id, use_transcript=False):
 
     content = "The user will ask a question about a given meeting. Please provide a 2-3 sentence response to the user's question."
 
     meeting_data = get_meeting_data(org_name, org_id, meeting_id)
 
-    content += " " + str(meeting_data['raw_text'])
+    model = "gpt-4o"
+    temperature = 0
+
+    cache_key = response_cache.make_key(model, content, prompt, [meeting_data], use_transcript=bool(use_transcript))
+    cached_reply = response_cache.get_reply(cache_key)
+    if cached_reply is not None:
+        return cached_reply
+
+    if use_transcript:
+        content += " " + str(meeting_data['raw_text'])
+    else:
+        content += " " + meeting_digest(meeting_data)["text"]
 
     content += " " + str(prompt)
 
@@ -371,9 +409,6 @@ def generate_ai_reply_for_meeting(prompt, meeting_id, user_id, org_name, org_id)
         {"role": "system", "content": content},
     ]
 
-    model = "gpt-4o"
-    temperature = 0
-
     response = client.chat.completions.create(
         model=model,
         temperature=temperature,
@@ -382,4 +417,6 @@ def generate_ai_reply_for_meeting(prompt, meeting_id, user_id, org_name, org_id)
 
     ai_assistance, prompt_tokens, completion_tokens = [response.choices[0].message.content, response.usage.prompt_tokens, response.usage.completion_tokens]
 
+    response_cache.store_reply(cache_key, [meeting_data], ai_assistance)
+
     return ai_assistance
\ No newline at end of file
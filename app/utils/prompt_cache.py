@@ -0,0 +1,31 @@
+import os
+from threading import Lock
+from cachetools import TTLCache
+
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", 1024))
+PROMPT_CACHE_TTL = int(os.getenv("PROMPT_CACHE_TTL", 3600))
+
+# (org_name, org_id, what, *arguments, prompt generation) -> resolved value.
+# The org's prompt generation is bumped on every meeting type change, so
+# entries from before a change are never looked up again, in any process.
+cache = TTLCache(maxsize=PROMPT_CACHE_SIZE, ttl=PROMPT_CACHE_TTL)
+lock = Lock()
+
+def get(key):
+    with lock:
+        return cache.get(key)
+
+def store(key, value):
+    with lock:
+        cache[key] = value
+
+def invalidate_org(org_name, org_id):
+    """
+    Drop every cached entry for an org, so this process frees them straight
+    away instead of waiting for them to expire.
+    """
+
+    with lock:
+        stale = [key for key in cache.keys() if key[:2] == (org_name, org_id)]
+        for key in stale:
+            del cache[key]
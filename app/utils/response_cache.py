@@ -0,0 +1,61 @@
+import os
+import json
+import hashlib
+import logging
+from threading import Lock
+from cachetools import TTLCache
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1024))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 3600))
+
+# key -> (ids of the meetings the reply was based on, reply). Entries expire
+# after RESPONSE_CACHE_TTL seconds, and the least recently used are evicted
+# once RESPONSE_CACHE_SIZE is reached.
+cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+lock = Lock()
+
+def make_key(model, prompt, question, meetings, **options):
+    """
+    Content-addressed cache key for a model reply: a hash of the model, the
+    prompt, the question, any other options that change the reply, and the
+    id and version of every meeting in context.
+    """
+
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "question": question,
+        "options": options,
+        "meetings": sorted((str(meeting["_id"]), meeting.get("version", 0)) for meeting in meetings)
+    }
+
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def get_reply(key):
+    with lock:
+        entry = cache.get(key)
+
+    if entry is None:
+        return None
+
+    logging.info(f"Response cache hit for {key[:12]}")
+    return entry[1]
+
+def store_reply(key, meetings, reply):
+    with lock:
+        cache[key] = ({str(meeting["_id"]) for meeting in meetings}, reply)
+
+def invalidate_meeting(meeting_id):
+    """
+    Drop every cached reply that was based on the given meeting.
+    """
+
+    meeting_id = str(meeting_id)
+
+    with lock:
+        stale = [key for key, (meeting_ids, _) in cache.items() if meeting_id in meeting_ids]
+        for key in stale:
+            del cache[key]
+
+    if stale:
+        logging.info(f"Invalidated {len(stale)} cached replies for meeting {meeting_id}")
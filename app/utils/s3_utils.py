@@ -22,6 +22,12 @@ def read_text_file(file_key):
 
     return file_content
 
+def read_object_bytes(key, bucket_name=bucket_name):
+    """Read an S3 object straight into memory."""
+    response = s3_client.get_object(Bucket=bucket_name, Key=key)
+
+    return response["Body"].read()
+
 def list_files(bucket_name, prefix):
     """List files in an S3 bucket."""
     # List objects within the bucket
@@ -36,31 +42,13 @@ def list_files(bucket_name, prefix):
     else:
         return []
 
-def download_file(bucket_name, item, user, report, date, file):
-    """Download a file from S3."""
-    # Local path where you want to save the downloaded file
-    folder_file_path = os.path.join(f"tmp_{user}", "downloaded_webm_file", user, report, date)
-    local_file_path = os.path.join(folder_file_path, file)
+def list_all_files(bucket_name, prefix=""):
+    """List every file in an S3 bucket, following pagination."""
+    paginator = s3_client.get_paginator("list_objects_v2")
 
-    if not os.path.exists(folder_file_path):
-        os.makedirs(folder_file_path)
-    
-    # Download the file
-    s3_client.download_file(bucket_name, item, local_file_path)
-
-def check_existing_s3_files():
-    response = s3_client.list_objects_v2(Bucket=bucket_name)
-    list_of_files = []
-
-    # Check if 'Contents' key is in the response (it won't be if the bucket is empty)
-    if 'Contents' in response:
-        for item in response['Contents']:
-            list_of_files.append(item["Key"])
-
-        return list_of_files
-    else:
-        print("No items in the bucket.")
-        return []
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for item in page.get("Contents", []):
+            yield item["Key"]
 
 def upload_audio_to_s3(audio_stream, key, bucket_name=bucket_name):
     """Upload audio to S3."""
@@ -0,0 +1,194 @@
+import os
+import re
+import math
+import logging
+from collections import Counter
+import tiktoken
+
+# Transcript chunks live next to the meetings in each org database
+CHUNKS_COLLECTION = "TranscriptChunks"
+
+# Target size of each indexed passage, in model tokens
+CHUNK_TOKENS = int(os.getenv("TRANSCRIPT_CHUNK_TOKENS", 300))
+
+# BM25 tuning parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Words too common to say anything about which passage is relevant
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "did", "do", "does", "for", "from", "had", "has",
+    "have", "he", "her", "his", "how", "i", "if", "in", "is", "it", "its", "me", "my", "of", "on", "or", "our",
+    "she", "so", "that", "the", "their", "them", "there", "they", "this", "to", "was", "we", "were", "what",
+    "when", "where", "which", "who", "why", "will", "with", "you", "your"
+}
+
+encoding = tiktoken.encoding_for_model("gpt-4o")
+
+def count_tokens(text):
+    return len(encoding.encode(text))
+
+def truncate_tokens(text, max_tokens):
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+def tokenize(text):
+    """
+    Lowercase word terms used for BM25 scoring, without stop words.
+    """
+
+    return [term for term in re.findall(r"[a-z0-9']+", text.lower()) if term not in STOP_WORDS]
+
+def chunk_transcript(raw_text, chunk_tokens=CHUNK_TOKENS):
+    """
+    Split a transcript into passages of roughly chunk_tokens tokens, breaking
+    on sentence boundaries. Returns a list of (text, token count).
+    """
+
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+|\n+", raw_text or "") if s.strip()]
+
+    chunks = []
+    current, current_tokens = [], 0
+
+    for sentence in sentences:
+        sentence_tokens = count_tokens(sentence)
+
+        if current and current_tokens + sentence_tokens > chunk_tokens:
+            chunks.append((" ".join(current), current_tokens))
+            current, current_tokens = [], 0
+
+        current.append(sentence)
+        current_tokens += sentence_tokens
+
+    if current:
+        chunks.append((" ".join(current), current_tokens))
+
+    return chunks
+
+def index_meeting(database, meeting, collection_name="Meetings"):
+    """
+    (Re)build the transcript chunks for a meeting document. The meeting needs
+    _id, org_id, date, type_name, attendees and raw_text. The meeting is
+    marked transcript_indexed, so one whose transcript is empty and has no
+    chunks is not indexed again on every search.
+    """
+
+    collection = database[CHUNKS_COLLECTION]
+    collection.delete_many({"meeting_id": meeting["_id"]})
+
+    documents = []
+    for chunk_index, (text, tokens) in enumerate(chunk_transcript(meeting.get("raw_text"))):
+        terms = Counter(tokenize(text))
+        documents.append({
+            "org_id": meeting.get("org_id"),
+            "meeting_id": meeting["_id"],
+            "chunk_index": chunk_index,
+            "date": meeting.get("date"),
+            "type_name": meeting.get("type_name"),
+            "text": text,
+            "tokens": tokens,
+            "length": sum(terms.values()),
+            "terms": [{"t": term, "f": frequency} for term, frequency in terms.items()]
+        })
+
+    if documents:
+        collection.insert_many(documents)
+
+    database[collection_name].update_one({"_id": meeting["_id"]}, {"$set": {"transcript_indexed": True}})
+
+    logging.info(f"Indexed {len(documents)} transcript chunks for meeting {meeting['_id']}")
+
+def delete_meeting_chunks(database, meeting_id):
+    database[CHUNKS_COLLECTION].delete_many({"meeting_id": meeting_id})
+
+def index_missing_meetings(database, org_id, meeting_ids, collection_name="Meetings"):
+    """
+    Index any of the given meetings that have no chunks yet, e.g. meetings
+    saved before the index existed. Meetings already marked indexed are
+    skipped, since an empty transcript has no chunks.
+    """
+
+    indexed = set(database[CHUNKS_COLLECTION].distinct("meeting_id", {"org_id": org_id, "meeting_id": {"$in": meeting_ids}}))
+    missing = [meeting_id for meeting_id in meeting_ids if meeting_id not in indexed]
+
+    if not missing:
+        return
+
+    meetings = database[collection_name].find(
+        {"_id": {"$in": missing}, "transcript_indexed": {"$ne": True}},
+        {"org_id": 1, "date": 1, "type_name": 1, "raw_text": 1}
+    )
+
+    for meeting in meetings:
+        index_meeting(database, meeting, collection_name)
+
+def select_within_budget(chunks, token_budget, top_k):
+    """
+    Take chunks in order until top_k chunks are picked or the token budget is
+    used up, skipping chunks that would not fit.
+    """
+
+    selected, used = [], 0
+
+    for chunk in chunks:
+        if len(selected) >= top_k:
+            break
+        if used + chunk["tokens"] > token_budget:
+            continue
+        selected.append(chunk)
+        used += chunk["tokens"]
+
+    return selected
+
+def search_chunks(database, org_id, meeting_ids, question, token_budget, top_k):
+    """
+    BM25-rank the transcript chunks of the given meetings against a question
+    and return the best ones that fit in token_budget. Falls back to the
+    opening passages of the most recent meetings when nothing matches.
+    """
+
+    collection = database[CHUNKS_COLLECTION]
+    scope = {"org_id": org_id, "meeting_id": {"$in": meeting_ids}}
+
+    index_missing_meetings(database, org_id, meeting_ids)
+
+    query_terms = set(tokenize(question))
+
+    candidates = []
+    if query_terms:
+        candidates = list(collection.find(
+            {**scope, "terms.t": {"$in": list(query_terms)}},
+            {"meeting_id": 1, "chunk_index": 1, "date": 1, "text": 1, "tokens": 1, "length": 1, "terms": 1}
+        ))
+
+    if not candidates:
+        fallback = collection.find(
+            scope, {"meeting_id": 1, "chunk_index": 1, "date": 1, "text": 1, "tokens": 1}
+        ).sort([("date", -1), ("chunk_index", 1)])
+        return select_within_budget(fallback, token_budget, top_k)
+
+    # Corpus statistics for the meetings in scope
+    stats = list(collection.aggregate([
+        {"$match": scope},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "average_length": {"$avg": "$length"}}}
+    ]))
+    total_chunks = stats[0]["count"]
+    average_length = stats[0]["average_length"] or 1
+
+    # Every chunk containing a query term is a candidate, so document
+    # frequencies can be counted from the candidates alone
+    document_frequency = Counter()
+    for chunk in candidates:
+        chunk["frequencies"] = {term["t"]: term["f"] for term in chunk.pop("terms") if term["t"] in query_terms}
+        document_frequency.update(chunk["frequencies"].keys())
+
+    for chunk in candidates:
+        score = 0
+        for term, frequency in chunk["frequencies"].items():
+            idf = math.log(1 + (total_chunks - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            norm = frequency + BM25_K1 * (1 - BM25_B + BM25_B * chunk["length"] / average_length)
+            score += idf * frequency * (BM25_K1 + 1) / norm
+        chunk["score"] = score
+
+    candidates.sort(key=lambda chunk: chunk["score"], reverse=True)
+
+    return select_within_budget(candidates, token_budget, top_k)
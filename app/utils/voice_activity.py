@@ -0,0 +1,234 @@
+import os
+import sys
+import glob
+import logging
+import tempfile
+import subprocess
+import numpy as np
+
+# Audio is analysed as 16 kHz mono 16-bit PCM in 30 ms frames
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+FRAME_BYTES = FRAME_SAMPLES * 2
+
+# A frame is speech when its RMS energy is VAD_ENERGY_RATIO times the noise
+# floor and above VAD_MIN_ENERGY (on the 16-bit sample scale)
+VAD_ENERGY_RATIO = float(os.getenv("VAD_ENERGY_RATIO", 3))
+VAD_MIN_ENERGY = float(os.getenv("VAD_MIN_ENERGY", 150))
+
+# Pauses shorter than this are kept, and this much audio is kept either side
+# of speech so words are not clipped
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", 800))
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", 200))
+
+# Frames read from ffmpeg at a time when streaming a file
+BLOCK_FRAMES = 1000
+
+def decode_command(source):
+    return ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", source, "-vn",
+            "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"]
+
+def encode_command(destination, bitrate, max_seconds=None, segment_times=None):
+    """
+    ffmpeg command encoding PCM from stdin as Opus, either to a single ogg
+    file or, when max_seconds is given, to chunks cut at segment_times.
+    """
+
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+               "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-i", "pipe:0",
+               "-c:a", "libopus", "-b:a", bitrate, "-application", "voip"]
+
+    if max_seconds is None:
+        command += ["-f", "ogg"]
+    else:
+        # The segment muxer refuses -segment_time and -segment_times together.
+        # chunk_boundaries already places every cut, so the fixed length is
+        # only needed when there are none.
+        command += ["-f", "segment", "-reset_timestamps", "1"]
+        if segment_times:
+            command += ["-segment_times", ",".join(f"{time:.2f}" for time in segment_times)]
+        else:
+            command += ["-segment_time", str(max_seconds)]
+
+    return command + [destination]
+
+def frame_energies(samples):
+    """
+    RMS energy of each frame of PCM samples. A trailing partial frame is
+    ignored.
+    """
+
+    usable = len(samples) - len(samples) % FRAME_SAMPLES
+    frames = samples[:usable].astype(np.float32).reshape(-1, FRAME_SAMPLES)
+
+    return np.sqrt(np.mean(frames ** 2, axis=1))
+
+def stream_pcm(source, block_frames=BLOCK_FRAMES):
+    """
+    Decode a media file with ffmpeg and yield its PCM in blocks of whole
+    frames, so a long recording never has to sit in memory.
+    """
+
+    with subprocess.Popen(decode_command(source), stdout=subprocess.PIPE) as process:
+        while True:
+            block = process.stdout.read(block_frames * FRAME_BYTES)
+            if not block:
+                break
+            yield np.frombuffer(block[:len(block) - len(block) % 2], dtype=np.int16)
+
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode {source}")
+
+def speech_segments(energies):
+    """
+    Find the speech in a recording from its frame energies. The noise floor
+    is the 10th percentile frame, and the threshold is capped at a quarter of
+    the 90th percentile so a recording that is mostly talking keeps its
+    quieter words. Returns (start, end) frame ranges, padded and with short
+    pauses bridged.
+    """
+
+    if len(energies) == 0:
+        return []
+
+    noise_floor, loud = np.percentile(energies, [10, 90])
+    threshold = max(min(noise_floor * VAD_ENERGY_RATIO, loud / 4), VAD_MIN_ENERGY)
+    speech = energies > threshold
+
+    padding = VAD_PADDING_MS // FRAME_MS
+    min_silence = VAD_MIN_SILENCE_MS // FRAME_MS
+
+    # Start and end frames of each run of speech frames
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+
+    segments = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        start, end = max(0, int(start) - padding), min(len(energies), int(end) + padding)
+
+        if segments and start - segments[-1][1] < min_silence:
+            segments[-1] = (segments[-1][0], end)
+        else:
+            segments.append((start, end))
+
+    return segments
+
+def chunk_boundaries(segments, max_seconds):
+    """
+    Where to cut the speech-only audio into chunks of at most max_seconds, in
+    seconds of speech. Cuts fall between segments, i.e. at pauses, unless a
+    single segment is longer than a chunk.
+    """
+
+    max_frames = int(max_seconds * 1000 // FRAME_MS)
+    boundaries = []
+    chunk_start = position = 0
+
+    for start, end in segments:
+        length = end - start
+
+        if position + length - chunk_start > max_frames and position > chunk_start:
+            boundaries.append(position)
+            chunk_start = position
+
+        while position + length - chunk_start > max_frames:
+            chunk_start += max_frames
+            boundaries.append(chunk_start)
+
+        position += length
+
+    return [boundary * FRAME_MS / 1000 for boundary in boundaries]
+
+def extract_speech_chunks(source, chunk_pattern, max_seconds, bitrate):
+    """
+    Write only the speech in a media file to Opus chunks of at most
+    max_seconds, cut at pauses. The file is decoded twice, once to find the
+    speech and once to keep it, streaming both times so memory stays flat.
+    """
+
+    energies = np.concatenate([frame_energies(block) for block in stream_pcm(source)] or [np.zeros(0)])
+    segments = speech_segments(energies)
+
+    if not segments:
+        raise ValueError(f"No speech found in {source}")
+
+    keep = np.zeros(len(energies), dtype=bool)
+    for start, end in segments:
+        keep[start:end] = True
+
+    encoder = subprocess.Popen(encode_command(chunk_pattern, bitrate, max_seconds, chunk_boundaries(segments, max_seconds)),
+                               stdin=subprocess.PIPE)
+
+    frame = 0
+    try:
+        for block in stream_pcm(source):
+            frames = min(len(block) // FRAME_SAMPLES, len(keep) - frame)
+            block_frames = block[:frames * FRAME_SAMPLES].reshape(-1, FRAME_SAMPLES)
+            encoder.stdin.write(block_frames[keep[frame:frame + frames]].tobytes())
+            frame += frames
+    finally:
+        encoder.stdin.close()
+
+    if encoder.wait() != 0:
+        raise RuntimeError(f"ffmpeg could not encode the speech in {source}")
+
+    logging.info(f"Kept {keep.sum() * FRAME_MS / 1000:.0f}s of speech from {len(keep) * FRAME_MS / 1000:.0f}s of audio in {source}")
+
+def trim_silence(audio_bytes, bitrate):
+    """
+    Drop the silence from an in-memory recording and return the speech as
+    Opus in an ogg container. Raises ValueError if the audio cannot be
+    decoded or has no speech in it.
+    """
+
+    result = subprocess.run(decode_command("pipe:0"), input=audio_bytes, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if result.returncode != 0 or not result.stdout:
+        raise ValueError("Audio could not be decoded for transcription.")
+
+    samples = np.frombuffer(result.stdout[:len(result.stdout) - len(result.stdout) % 2], dtype=np.int16)
+    segments = speech_segments(frame_energies(samples))
+
+    if not segments:
+        raise ValueError("Audio has no speech to transcribe.")
+
+    speech = np.concatenate([samples[start * FRAME_SAMPLES:end * FRAME_SAMPLES] for start, end in segments])
+
+    result = subprocess.run(encode_command("pipe:1", bitrate), input=speech.tobytes(),
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+
+    return result.stdout
+
+def check_segmenting(seconds=12, max_seconds=3):
+    """
+    Encode a few seconds of generated speech-like audio through
+    extract_speech_chunks with several chunk boundaries, and check ffmpeg
+    accepts the segment options and writes one chunk per boundary.
+    """
+
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, "sample.wav")
+
+        # A tone that is on for a second and off for half a second, so there
+        # are pauses to cut at
+        subprocess.run([
+            "ffmpeg", "-nostdin", "-loglevel", "error", "-f", "lavfi",
+            "-i", f"sine=frequency=300:duration={seconds}",
+            "-af", "volume='if(lt(mod(t,1.5),1),1,0)':eval=frame", source
+        ], check=True)
+
+        chunk_pattern = os.path.join(folder, "chunk_%04d.ogg")
+        extract_speech_chunks(source, chunk_pattern, max_seconds, "24k")
+
+        chunks = sorted(glob.glob(os.path.join(folder, "chunk_*.ogg")))
+        energies = np.concatenate([frame_energies(block) for block in stream_pcm(source)])
+        expected = len(chunk_boundaries(speech_segments(energies), max_seconds)) + 1
+
+        print(f"Wrote {len(chunks)} chunks, expected {expected}")
+        if len(chunks) != expected:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    # python -m app.utils.voice_activity
+    logging.basicConfig(level=logging.INFO)
+
+    check_segmenting()